@@ -0,0 +1,254 @@
+"""
+本地模拟供应商服务，返回 OpenAI / Anthropic / Dify 格式的响应，用于无密钥的性能基准
+
+    python -m bench.mock_server --port 8901 --latency lognormal:0.05,0.5 --error-rate 0.01 --rate-429 0.01
+    python -m bench.mock_server --capacity 20   # 模拟供应商容量，超出并发返回 429
+
+各供应商的 base_url 分别为 http://127.0.0.1:8901/openai、/anthropic、/dify
+"""
+import argparse
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def parse_latency(spec: str):
+    """
+    延迟分布：fixed:0.05 | uniform:0.02,0.2 | lognormal:中位数,sigma | exp:均值，单位秒
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",")] if args else []
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / values[0])
+    raise ValueError(f"Unknown latency distribution {spec}")
+
+def _prompt(provider: str, body: dict) -> str:
+    field = body.get("query" if provider == "dify" else "messages")
+    if isinstance(field, list) and field:
+        return str(field[-1].get("content", ""))
+    return str(field or "")
+
+def _answer(prompt: str, size: int) -> str:
+    text = f"mock:{len(prompt)}:"
+    return (text * (size // len(text) + 1))[:size]
+
+def completion(provider: str, answer: str) -> dict:
+    if provider == "openai":
+        return {"id": "chatcmpl-mock", "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": answer},
+                             "finish_reason": "stop"}]}
+    if provider == "anthropic":
+        return {"id": "msg_mock", "type": "message", "role": "assistant",
+                "content": [{"type": "text", "text": answer}], "stop_reason": "end_turn"}
+    return {"event": "message", "message_id": "mock", "answer": answer}
+
+def stream_events(provider: str, answer: str, chunks: int):
+    step = max(len(answer) // chunks, 1)
+    pieces = [answer[i:i + step] for i in range(0, len(answer), step)]
+    for piece in pieces:
+        if provider == "openai":
+            yield {"choices": [{"index": 0, "delta": {"content": piece}}]}
+        elif provider == "anthropic":
+            yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}}
+        else:
+            yield {"event": "message", "answer": piece}
+    if provider == "anthropic":
+        yield {"type": "message_stop"}
+    elif provider == "dify":
+        yield {"event": "message_end"}
+
+class MockState:
+    def __init__(self, options):
+        self.latency = parse_latency(options.latency)
+        self.error_rate = options.error_rate
+        self.rate_429 = options.rate_429
+        self.response_chars = options.response_chars
+        self.stream_chunks = options.stream_chunks
+        self.chunk_delay = options.chunk_delay
+        self.capacity = options.capacity
+        self.active = 0
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    def next_id(self, prefix: str) -> str:
+        with self.lock:
+            self.counter += 1
+            return f"{prefix}_{self.counter}"
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出，不关闭 Nagle 会与客户端的延迟确认叠加出约 40ms 的额外延迟
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def _send_json(self, data, status: int = 200, headers=None):
+        body = data if isinstance(data, bytes) else json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_POST(self):
+        provider, _, path = self.path.lstrip("/").partition("/")
+        raw = self._read_body()
+        if provider == "openai" and path == "files":
+            return self._upload_file(raw)
+        body = json.loads(raw or b"{}")
+        if provider == "openai" and path == "batches":
+            return self._create_batch("openai", body)
+        if provider == "anthropic" and path == "messages/batches":
+            return self._create_batch("anthropic", body)
+        if provider not in ("openai", "anthropic", "dify"):
+            return self._send_json({"error": {"message": "not found"}}, 404)
+
+        state = self.state
+        with state.lock:
+            state.active += 1
+            overloaded = bool(state.capacity) and state.active > state.capacity
+        try:
+            roll = random.random()
+            if overloaded or roll < state.rate_429:
+                return self._send_json({"error": {"message": "rate limited"}}, 429, {"Retry-After": "1"})
+            time.sleep(state.latency())
+            if roll < state.rate_429 + state.error_rate:
+                return self._send_json({"error": {"message": "mock server error"}}, 500)
+
+            answer = _answer(_prompt(provider, body), state.response_chars)
+            if body.get("stream") or body.get("response_mode") == "streaming":
+                return self._stream(provider, answer)
+            self._send_json(completion(provider, answer))
+        finally:
+            with state.lock:
+                state.active -= 1
+
+    def _stream(self, provider: str, answer: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write(data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        for event in stream_events(provider, answer, self.state.stream_chunks):
+            write(b"data: " + json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            if self.state.chunk_delay:
+                time.sleep(self.state.chunk_delay)
+        if provider == "openai":
+            write(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _upload_file(self, raw: bytes):
+        # 只解析 multipart 中的文件部分
+        boundary = self.headers["Content-Type"].split("boundary=")[1].encode()
+        part = next(p for p in raw.split(b"--" + boundary) if b"filename=" in p)
+        content = part.split(b"\r\n\r\n", 1)[1].rsplit(b"\r\n", 1)[0]
+        file_id = self.state.next_id("file")
+        self.state.files[file_id] = content
+        self._send_json({"id": file_id, "object": "file", "purpose": "batch"})
+
+    def _create_batch(self, provider: str, body: dict):
+        # 批量任务在创建时同步生成结果，首次查询即为完成状态
+        size = self.state.response_chars
+        lines = []
+        if provider == "openai":
+            for line in self.state.files[body["input_file_id"]].splitlines():
+                request = json.loads(line)
+                answer = _answer(_prompt("openai", request["body"]), size)
+                lines.append({"custom_id": request["custom_id"], "error": None,
+                              "response": {"status_code": 200, "body": completion("openai", answer)}})
+        else:
+            for request in body["requests"]:
+                answer = _answer(_prompt("anthropic", request["params"]), size)
+                lines.append({"custom_id": request["custom_id"],
+                              "result": {"type": "succeeded", "message": completion("anthropic", answer)}})
+        batch_id = self.state.next_id("batch")
+        output_id = self.state.next_id("file")
+        self.state.files[output_id] = b"".join(json.dumps(line).encode("utf-8") + b"\n" for line in lines)
+        self.state.batches[batch_id] = output_id
+        if provider == "openai":
+            return self._send_json({"id": batch_id, "status": "validating"})
+        self._send_json({"id": batch_id, "processing_status": "in_progress"})
+
+    def do_GET(self):
+        provider, _, path = self.path.lstrip("/").partition("/")
+        parts = path.split("/")
+        host = f"http://{self.headers.get('Host')}"
+        if provider == "openai" and parts[0] == "batches":
+            return self._send_json({"id": parts[1], "status": "completed",
+                                    "output_file_id": self.state.batches[parts[1]]})
+        if provider == "openai" and parts[0] == "files" and parts[-1] == "content":
+            return self._send_json(self.state.files[parts[1]])
+        if provider == "anthropic" and parts[:2] == ["messages", "batches"]:
+            batch_id = parts[2]
+            if len(parts) == 4 and parts[3] == "results":
+                return self._send_json(self.state.files[self.state.batches[batch_id]])
+            return self._send_json({"id": batch_id, "processing_status": "ended",
+                                    "results_url": f"{host}/anthropic/messages/batches/{batch_id}/results"})
+        self._send_json({"error": {"message": "not found"}}, 404)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # 客户端取消请求（例如对冲请求的落后一方）时连接被提前关闭，不打印堆栈
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Mock LLM provider server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901, help="0 表示随机端口")
+    parser.add_argument("--latency", default="lognormal:0.02,0.3")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=200)
+    parser.add_argument("--stream-chunks", type=int, default=20)
+    parser.add_argument("--chunk-delay", type=float, default=0.0)
+    parser.add_argument("--capacity", type=int, default=0, help="同时处理的请求数上限，超出时返回 429，0 表示不限")
+    return parser
+
+def serve(options) -> MockServer:
+    server = MockServer((options.host, options.port), MockHandler)
+    server.state = MockState(options)
+    return server
+
+def main():
+    options = build_parser().parse_args()
+    server = serve(options)
+    # 第一行输出实际端口，供 bench.run 读取
+    print(f"listening {server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
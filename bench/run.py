@@ -0,0 +1,278 @@
+"""
+请求路径的本地基准：启动 bench.mock_server，按场景矩阵驱动 RequestCoordinator.batch_request、
+APIClient.send_request 与 stream_request，输出 JSON 结果并可与历史结果对比
+
+    python -m bench.run                       # 完整矩阵，结果写入 bench/results/<时间>.json
+    python -m bench.run --quick --filter batch
+    python -m bench.run --compare bench/results/a.json bench/results/b.json --threshold 0.1
+
+每个场景在独立子进程中运行，CPU 时间与峰值内存互不影响
+"""
+import argparse
+import copy
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+PROVIDERS = ("openai", "anthropic", "dify")
+
+def default_matrix(requests: int, quick: bool = False):
+    """场景矩阵：批量模式覆盖线程数 × 缓存命中率 × 消息长度，另有单线程 send 与流式场景"""
+    workers_options = (5,) if quick else (1, 5, 20)
+    hit_options = (0.0,) if quick else (0.0, 0.5)
+    size_options = (200,) if quick else (200, 2000)
+    scenarios = []
+    for workers in workers_options:
+        for hit_ratio in hit_options:
+            for size in size_options:
+                scenarios.append({
+                    "name": f"batch-dify-w{workers}-h{int(hit_ratio * 100)}-s{size}",
+                    "mode": "batch", "provider": "dify", "workers": workers,
+                    "cache_hit_ratio": hit_ratio, "message_chars": size, "requests": requests,
+                })
+    for provider in PROVIDERS:
+        scenarios.append({
+            "name": f"send-{provider}-s200", "mode": "send", "provider": provider, "workers": 1,
+            "cache_hit_ratio": 0.0, "message_chars": 200, "requests": requests,
+        })
+    scenarios.append({
+        "name": "stream-openai-s200", "mode": "stream", "provider": "openai", "workers": 1,
+        "cache_hit_ratio": 0.0, "message_chars": 200, "requests": requests,
+    })
+    return scenarios
+
+def make_messages(count: int, size: int):
+    """生成与 construct_msg_description 相同形式的 `列名: 值` 消息，彼此不同"""
+    filler = "某地发生纠纷，当事人情绪激动，现场已处置。"
+    messages = []
+    for i in range(count):
+        head = f"案件编号: BENCH{i:08d}\n描述: "
+        body = (filler * (size // len(filler) + 1))[:max(size - len(head), 0)]
+        messages.append(head + body)
+    return messages
+
+def bench_config(base_url: str):
+    """在 config.yaml 基础上指向模拟服务，去掉限流、磁盘缓存与近似重复等与客户端开销无关的设置"""
+    from src.config import Config
+
+    data = copy.deepcopy(Config.get_instance().config)
+    api_config = data.setdefault("api_config", {})
+    api_config["providers"] = {
+        provider: {
+            "base_url": f"{base_url}/{provider}",
+            "keys": [f"bench-{provider}-1", f"bench-{provider}-2"],
+            "connect_timeout": 5,
+            "read_timeout": 30,
+        }
+        for provider in PROVIDERS
+    }
+    api_config["default_provider"] = "dify"
+    api_config["retry"] = {**api_config.get("retry", {}), "base_delay": 0.05, "max_delay": 1}
+    cache = api_config.setdefault("cache", {})
+    cache["near_duplicate"] = {"enabled": False}
+    api_config["packing"] = {"enabled": False}
+    return Config.from_dict(data)
+
+class TimedClient:
+    """记录每次 send_request 的端到端耗时，其余属性转发给被包装的客户端"""
+
+    def __init__(self, client):
+        self.client = client
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def send_request(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = self.client.send_request(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            if not result["success"]:
+                self.errors += 1
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows 上没有 resource 模块
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+def run_scenario(scenario: dict, base_url: str) -> dict:
+    """在当前进程中运行一个场景并返回指标"""
+    from src.balancer import LoadBalancer
+    from src.cache import MessageCache
+    from src.client import APIClient
+    from src.monitor import PerformanceMonitor
+    from src.requestor import RequestCoordinator
+
+    config = bench_config(base_url)
+    count = scenario["requests"]
+    client = APIClient(MessageCache(max_size=count * 2), PerformanceMonitor(),
+                       LoadBalancer(config.api_config["providers"], config.api_config.get("balancer")), config)
+    provider = scenario["provider"]
+    messages = make_messages(count, scenario["message_chars"])
+    # 预热：按命中率先请求一部分消息，测量阶段这些消息命中缓存
+    for message in messages[:int(count * scenario["cache_hit_ratio"])]:
+        client.send_request(message, provider=provider)
+    random.Random(0).shuffle(messages)
+
+    timed = TimedClient(client)
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    if scenario["mode"] == "batch":
+        RequestCoordinator(timed, scenario["workers"]).batch_request(messages, provider=provider)
+    elif scenario["mode"] == "send":
+        for message in messages:
+            timed.send_request(message, provider=provider)
+    elif scenario["mode"] == "stream":
+        for message in messages:
+            start = time.perf_counter()
+            try:
+                "".join(client.stream_request(message, provider=provider))
+            except Exception:
+                timed.errors += 1
+            timed.latencies.append(time.perf_counter() - start)
+    else:
+        raise ValueError(f"Unknown mode {scenario['mode']}")
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    client.close()
+
+    latencies = sorted(timed.latencies)
+    completed = len(latencies)
+    return {
+        **scenario,
+        "completed": completed,
+        "errors": timed.errors,
+        "wall_seconds": wall,
+        "rps": completed / wall if wall else 0.0,
+        "mean": sum(latencies) / completed if completed else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "cpu_ms_per_request": cpu / completed * 1000 if completed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def start_mock_server(options):
+    command = [sys.executable, "-m", "bench.mock_server", "--port", "0",
+               "--latency", options.latency, "--error-rate", str(options.error_rate),
+               "--rate-429", str(options.rate_429), "--response-chars", str(options.response_chars)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("listening"):
+        process.kill()
+        raise RuntimeError("Mock server failed to start")
+    return process, f"http://127.0.0.1:{line.split()[1]}"
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_all(options) -> dict:
+    scenarios = [s for s in default_matrix(options.requests, options.quick)
+                 if not options.filter or options.filter in s["name"]]
+    server, base_url = start_mock_server(options)
+    results = []
+    try:
+        for scenario in scenarios:
+            output = subprocess.run([sys.executable, "-m", "bench.run", "--worker", json.dumps(scenario),
+                                     "--base-url", base_url], cwd=ROOT, capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{scenario['name']}: failed\n{output.stderr}", file=sys.stderr)
+                continue
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{result['name']:<32} {result['rps']:>9.1f} req/s  p50 {result['p50'] * 1000:>7.1f} ms  "
+                  f"p99 {result['p99'] * 1000:>7.1f} ms  cpu {result['cpu_ms_per_request']:>6.2f} ms/req  "
+                  f"errors {result['errors']}")
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "server": {"latency": options.latency, "error_rate": options.error_rate,
+                       "rate_429": options.rate_429, "response_chars": options.response_chars},
+        },
+        "scenarios": results,
+    }
+
+def compare(base_path, new_path, threshold: float) -> int:
+    """对比两次结果：吞吐下降或 p99 / 单请求 CPU 上升超过 threshold 视为回退，存在回退时返回 1"""
+    base = {s["name"]: s for s in json.loads(Path(base_path).read_text(encoding="utf-8"))["scenarios"]}
+    new = {s["name"]: s for s in json.loads(Path(new_path).read_text(encoding="utf-8"))["scenarios"]}
+    regressions = 0
+
+    def change(old, value):
+        return (value - old) / old if old else 0.0
+
+    print(f"{'scenario':<32} {'req/s':>9} {'p99':>9} {'cpu/req':>9}")
+    for name in sorted(base.keys() & new.keys()):
+        old, cur = base[name], new[name]
+        rps = change(old["rps"], cur["rps"])
+        p99 = change(old["p99"], cur["p99"])
+        cpu = change(old["cpu_ms_per_request"], cur["cpu_ms_per_request"])
+        regressed = rps < -threshold or p99 > threshold or cpu > threshold
+        regressions += regressed
+        print(f"{name:<32} {rps:>+8.1%} {p99:>+8.1%} {cpu:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    for name in sorted(base.keys() ^ new.keys()):
+        print(f"{name:<32} only in {'base' if name in base else 'new'}")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Request path benchmark against the local mock server")
+    parser.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    parser.add_argument("--quick", action="store_true", help="只运行精简矩阵")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的场景")
+    parser.add_argument("--output", help="结果文件路径，默认 bench/results/<时间>.json")
+    parser.add_argument("--latency", default="lognormal:0.02,0.3")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--response-chars", type=int, default=200)
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--threshold", type=float, default=0.1)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.compare:
+        sys.exit(compare(*options.compare, options.threshold))
+    if options.worker:
+        print(json.dumps(run_scenario(json.loads(options.worker), options.base_url)))
+        return
+
+    report = run_all(options)
+    output = Path(options.output) if options.output else RESULTS_DIR / time.strftime("%Y%m%d-%H%M%S.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
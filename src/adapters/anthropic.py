@@ -1,12 +1,19 @@
 from .base import BaseAdapter
 
 class AnthropicAdapter(BaseAdapter):
-    def format_request(self, message: str, **kwargs):
-        base_payload = {
-            "messages": [{"role": "user", "content": message}],
-            **self.config['required_params']
-        }
-        return {**base_payload, **kwargs}
+    def parse_stream_event(self, event: dict):
+        if event.get('type') == 'error':
+            raise RuntimeError(event.get('error', {}).get('message', 'Anthropic stream error'))
+        if event.get('type') == 'content_block_delta':
+            return event.get('delta', {}).get('text')
+        return None
     
-    def parse_response(self, response: dict) -> str:
-        return self.jsonpath_extract(response, self.config['content_field'])
\ No newline at end of file
+    def batch_request_line(self, custom_id: str, message: str, **kwargs) -> dict:
+        return {"custom_id": custom_id, "params": self.format_request(message, **kwargs)}
+    
+    def parse_batch_result(self, line: dict):
+        result = line.get('result') or {}
+        if result.get('type') == 'succeeded':
+            return line['custom_id'], result.get('message'), None
+        error = (result.get('error') or {}).get('error') or result.get('error') or {}
+        return line['custom_id'], None, error.get('message') or f"batch request {result.get('type')}"
\ No newline at end of file
@@ -1,22 +1,144 @@
+import re
+import json
 from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Optional
 import jsonpath_rw
 
+try:
+    import orjson
+
+    def dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    loads_bytes = orjson.loads
+except ImportError:  # orjson 为可选加速依赖
+    def dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    loads_bytes = json.loads
+
+_SIMPLE_PATH = re.compile(r'^[A-Za-z_]\w*(\[\d+\])*(\.[A-Za-z_]\w*(\[\d+\])*)*$')
+_PATH_TOKEN = re.compile(r'([A-Za-z_]\w*)|\[(\d+)\]')
+
+@lru_cache(maxsize=None)
+def compile_path(path: str):
+    """将 content_field 编译为提取函数；形如 `choices[0].message.content` 的简单路径直接索引"""
+    if _SIMPLE_PATH.match(path):
+        steps = tuple(name if name else int(index) for name, index in _PATH_TOKEN.findall(path))
+
+        def extract(data):
+            try:
+                for step in steps:
+                    data = data[step]
+                return data
+            except (KeyError, IndexError, TypeError):
+                return None
+        return extract
+
+    expr = jsonpath_rw.parse(path)
+
+    def extract(data):
+        matches = expr.find(data)
+        return matches[0].value if matches else None
+    return extract
+
+class PayloadTemplate:
+    """预序列化请求体中的固定部分，每次只拼接消息与调用参数"""
+
+    def __init__(self, message_field: str, required_params: dict):
+        self.required_params = required_params
+        self.prefix = b'{' + dumps_bytes(message_field) + b':[{"role":"user","content":'
+        self._fragments = {}
+
+    def _static_fragment(self, overridden: frozenset) -> bytes:
+        fragment = self._fragments.get(overridden)
+        if fragment is None:
+            params = {k: v for k, v in self.required_params.items() if k not in overridden}
+            fragment = b''.join(b',' + dumps_bytes(k) + b':' + dumps_bytes(v) for k, v in params.items())
+            self._fragments[overridden] = fragment
+        return fragment
+
+    def render(self, message: str, params: dict) -> bytes:
+        overridden = frozenset(k for k in params if k in self.required_params)
+        parts = [self.prefix, dumps_bytes(message), b'}]', self._static_fragment(overridden)]
+        for k, v in params.items():
+            parts.append(b',' + dumps_bytes(k) + b':' + dumps_bytes(v))
+        parts.append(b'}')
+        return b''.join(parts)
+
+class SSEParser:
+    """增量解析 Server-Sent Events，逐行喂入，完整事件返回其 data 的 JSON 对象"""
+    DONE = object()
+
+    def __init__(self):
+        self._data = []
+
+    def feed(self, line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.rstrip('\r\n')
+        if line:
+            if line.startswith('data:'):
+                self._data.append(line[5:].lstrip(' '))
+            return None
+        # 空行表示一个事件结束
+        if not self._data:
+            return None
+        data, self._data = "\n".join(self._data), []
+        if data == "[DONE]":
+            return self.DONE
+        return json.loads(data)
+
 class BaseAdapter(ABC):
+    message_field = "messages"
+    stream_params = {"stream": True}
+    
     def __init__(self, config):
         self.config = config
+        self.required_params = config.get('required_params', {})
+        self.extract = compile_path(config['content_field']) if config.get('content_field') else None
+        self.template = PayloadTemplate(self.message_field, self.required_params)
     
-    @abstractmethod
     def format_request(self, message: str, **kwargs) -> dict:
         """将通用消息格式转换为供应商特定格式"""
-        pass
+        base_payload = {
+            self.message_field: [{"role": "user", "content": message}],
+            **self.required_params
+        }
+        return {**base_payload, **kwargs}
+    
+    def build_body(self, message: str, **kwargs) -> bytes:
+        """与 format_request 等价的已序列化请求体"""
+        return self.template.render(message, kwargs)
+    
+    def format_stream_request(self, message: str, **kwargs) -> dict:
+        """构建流式请求，开启方式由 stream_params 决定"""
+        return self.format_request(message, **{**kwargs, **self.stream_params})
+    
+    def build_stream_body(self, message: str, **kwargs) -> bytes:
+        return self.template.render(message, {**kwargs, **self.stream_params})
+    
+    def max_tokens(self, kwargs: dict) -> int:
+        return int(kwargs.get('max_tokens', self.required_params.get('max_tokens', 0)) or 0)
     
-    @abstractmethod
     def parse_response(self, response: dict) -> str:
         """从供应商响应中提取标准化的内容"""
+        return self.extract(response)
+    
+    def batch_request_line(self, custom_id: str, message: str, **kwargs) -> dict:
+        """构建批量接口中的一条请求，不支持批量接口的供应商抛出 ValueError"""
+        raise ValueError(f"{type(self).__name__} does not support batch requests")
+    
+    def parse_batch_result(self, line: dict):
+        """解析批量结果中的一行，返回 (custom_id, 响应体, 错误信息)"""
+        raise ValueError(f"{type(self).__name__} does not support batch requests")
+    
+    @abstractmethod
+    def parse_stream_event(self, event: dict) -> Optional[str]:
+        """从单个流式事件中提取增量内容，无内容时返回 None"""
         pass
     
     @staticmethod
     def jsonpath_extract(data, path):
-        expr = jsonpath_rw.parse(path)
-        matches = [match.value for match in expr.find(data)]
-        return matches[0] if matches else None
\ No newline at end of file
+        return compile_path(path)(data)
@@ -1,12 +1,12 @@
 from .base import BaseAdapter
 
 class DifyAdapter(BaseAdapter):
-    def format_request(self, message: str, **kwargs):
-        base_payload = {
-            "query": [{"role": "user", "content": message}],
-            **self.config['required_params']
-        }
-        return {**base_payload, **kwargs}
+    message_field = "query"
+    stream_params = {"response_mode": "streaming"}
     
-    def parse_response(self, response: dict) -> str:
-        return self.jsonpath_extract(response, self.config['content_field'])
\ No newline at end of file
+    def parse_stream_event(self, event: dict):
+        if event.get('event') == 'error':
+            raise RuntimeError(event.get('message', 'Dify stream error'))
+        if event.get('event') in ('message', 'agent_message'):
+            return event.get('answer')
+        return None
\ No newline at end of file
@@ -1,12 +1,22 @@
 from .base import BaseAdapter
 
 class OpenAIAdapter(BaseAdapter):
-    def format_request(self, message: str, **kwargs):
-        base_payload = {
-            "messages": [{"role": "user", "content": message}],
-            **self.config['required_params']
+    def parse_stream_event(self, event: dict):
+        choices = event.get('choices') or [{}]
+        return (choices[0].get('delta') or {}).get('content')
+    
+    def batch_request_line(self, custom_id: str, message: str, **kwargs) -> dict:
+        endpoint = self.config.get('endpoint', '/chat/completions')
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": self.config.get('batch_url', f"/v1{endpoint}"),
+            "body": self.format_request(message, **kwargs),
         }
-        return {**base_payload, **kwargs}
     
-    def parse_response(self, response: dict) -> str:
-        return self.jsonpath_extract(response, self.config['content_field'])
\ No newline at end of file
+    def parse_batch_result(self, line: dict):
+        response = line.get('response') or {}
+        if line.get('error') or response.get('status_code', 200) >= 400:
+            error = line.get('error') or (response.get('body') or {}).get('error') or {}
+            return line['custom_id'], None, error.get('message') or f"HTTP {response.get('status_code')}"
+        return line['custom_id'], response.get('body'), None
\ No newline at end of file
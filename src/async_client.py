@@ -0,0 +1,252 @@
+import time
+import asyncio
+import logging
+import aiohttp
+from typing import Optional
+from .client import APIClient
+from .adapters.base import SSEParser, loads_bytes
+from .cache import AsyncSingleFlight
+from .ratelimit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+class AsyncAPIClient(APIClient):
+    """基于 asyncio/aiohttp 的客户端，复用同步客户端的适配器、缓存、负载均衡和监控"""
+
+    def __init__(self, cache, monitor, balancer, config):
+        super().__init__(cache, monitor, balancer, config)
+        self.async_sessions = {}
+        self._async_inflight = AsyncSingleFlight()
+
+    def _get_async_session(self, provider: str) -> aiohttp.ClientSession:
+        """每个供应商共享一个带连接池的 ClientSession，需在事件循环内调用"""
+        session = self.async_sessions.get(provider)
+        if session is None or session.closed:
+            provider_config = self.balancer.providers[provider]
+            limit = provider_config.get(
+                'async_pool_size', provider_config.get(
+                    'pool_size', self.config.api_config.get('max_concurrency', 100)))
+            connect_timeout, read_timeout = self._get_timeout(provider)
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=limit, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                              sock_read=read_timeout)
+            )
+            self.async_sessions[provider] = session
+        return session
+
+    async def _throttle(self, provider: str, selected_key: str, tokens: int):
+        """按 RPM/TPM 限额在事件循环上等待，不占用线程"""
+        wait = self.rate_limiter.reserve(provider, selected_key, tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _acquire_slot(self, provider: str, selected_key: str):
+        """等待自适应并发名额；等待中被取消（如对冲落后的一方）时归还已选出的 Key"""
+        if self.concurrency is None:
+            return
+        try:
+            await self.concurrency.acquire_async(provider, selected_key)
+        except asyncio.CancelledError:
+            self.balancer.release(provider, selected_key, None)
+            raise
+
+    async def aclose(self):
+        for session in self.async_sessions.values():
+            await session.close()
+        self.async_sessions.clear()
+        self.close()
+
+    async def send_request(self,
+                           message: str,
+                           provider: Optional[str] = None,
+                           api_key: Optional[str] = None,
+                           key_index: Optional[int] = None,
+                           stage: Optional[str] = None,
+                           **kwargs):
+        provider = self._resolve_provider(provider, api_key)
+        cache_key, fingerprint, cached, similar = self._lookup(provider, message, kwargs, stage, api_key, key_index)
+        if cached:
+            return cached
+
+        result, shared = await self._async_inflight.do(
+            cache_key,
+            lambda: self._send(message, provider, api_key, key_index, cache_key, **kwargs)
+        )
+        if shared:
+            self.monitor.record_coalesced(provider)
+        return self._remember(provider, kwargs, cache_key, fingerprint, result, similar, api_key, key_index)
+
+    async def _send(self, message, provider, api_key, key_index, cache_key, **kwargs):
+        attempt, backoff_time, exclude = 0, 0.0, ()
+        tried_keys = []
+        while True:
+            selected_provider, selected_key = self._select_key(provider, api_key, key_index, exclude)
+            tried_keys.append(selected_key)
+            result, error = await self._hedged_attempt(message, selected_provider, selected_key, cache_key,
+                                                       bool(api_key) or key_index is not None, **kwargs)
+            if error is None:
+                if attempt:
+                    self.monitor.record_retry(selected_provider, attempt, backoff_time)
+                return result
+
+            retry = self._next_retry(selected_provider, attempt, backoff_time, error,
+                                     api_key, key_index, tuple(tried_keys))
+            if retry is None:
+                return result
+            delay, exclude = retry
+            await asyncio.sleep(delay)
+            attempt += 1
+            backoff_time += delay
+
+    async def _hedged_attempt(self, message, provider, selected_key, cache_key, pinned, **kwargs):
+        """_hedged_attempt 的异步版本，先成功的一方返回后取消另一方"""
+        delay = self.hedging.delay(provider) if self.hedging is not None and not pinned else None
+        if delay is None:
+            return await self._attempt(message, provider, selected_key, cache_key, **kwargs)
+
+        tasks = [asyncio.ensure_future(self._attempt(message, provider, selected_key, cache_key, **kwargs))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            hedge = self._select_hedge(provider, selected_key) if self.hedging.try_acquire() else None
+            if hedge is None:
+                return await tasks[0]
+
+            self.monitor.record_hedge(provider)
+            tasks.append(asyncio.ensure_future(self._attempt(message, *hedge, cache_key, **kwargs)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result, error = task.result()
+                    if error is None:
+                        if task is tasks[1]:
+                            self.monitor.record_hedge_win(provider)
+                        return result, error
+            return tasks[0].result()
+        finally:
+            # 落后的一方被取消，只释放 Key 与在途计数
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _attempt(self, message, provider, selected_key, cache_key, **kwargs):
+        adapter = self._get_adapter(provider)
+        url, headers = self._build_request(provider, selected_key)
+
+        await self._acquire_slot(provider, selected_key)
+        self.monitor.record_start(provider, selected_key)
+        start_time = time.time()
+        try:
+            body = adapter.build_body(message, **kwargs)
+            tokens = estimate_tokens(body, adapter.max_tokens(kwargs))
+            await self._throttle(provider, selected_key, tokens)
+            start_time = time.time()
+
+            session = self._get_async_session(provider)
+            async with session.post(url, headers=headers, data=body) as response:
+                response.raise_for_status()
+                payload = await response.read()
+
+            content = adapter.parse_response(loads_bytes(payload))
+            result = self._success_result(provider, content, payload)
+
+            self._record(provider, selected_key, True, time.time()-start_time)
+            if cache_key is not None:
+                self.cache.set(cache_key, result)
+            return result, None
+
+        except Exception as e:
+            logger.error(f"API request failed: {str(e) or type(e).__name__}")
+            self._record(provider, selected_key, False, time.time()-start_time, e)
+            return self._error_result(provider, e), e
+        except asyncio.CancelledError:
+            self._record_cancelled(provider, selected_key)
+            raise
+
+    async def stream_request(self,
+                             message: str,
+                             provider: Optional[str] = None,
+                             api_key: Optional[str] = None,
+                             key_index: Optional[int] = None,
+                             **kwargs):
+        """流式请求的异步版本，产出内容增量"""
+        provider = self._resolve_provider(provider, api_key)
+        cache_key = self._cache_key(provider, message, kwargs, api_key=api_key, key_index=key_index)
+        if cached := self.cache.get(cache_key):
+            self.monitor.record_cache(provider, True)
+            yield cached['content']
+            return
+        self.monitor.record_cache(provider, False)
+
+        attempt, backoff_time, exclude = 0, 0.0, ()
+        tried_keys = []
+        while True:
+            selected_provider, selected_key = self._select_key(provider, api_key, key_index, exclude)
+            tried_keys.append(selected_key)
+            chunks = []
+            try:
+                async for delta in self._stream_attempt(message, selected_provider, selected_key, **kwargs):
+                    chunks.append(delta)
+                    yield delta
+            except Exception as e:
+                retry = None if chunks else self._next_retry(
+                    selected_provider, attempt, backoff_time, e, api_key, key_index, tuple(tried_keys))
+                if retry is None:
+                    raise
+                delay, exclude = retry
+                await asyncio.sleep(delay)
+                attempt += 1
+                backoff_time += delay
+                continue
+
+            if attempt:
+                self.monitor.record_retry(selected_provider, attempt, backoff_time)
+            self.cache.set(cache_key, self._success_result(selected_provider, "".join(chunks), None))
+            return
+
+    async def _stream_attempt(self, message, provider, selected_key, **kwargs):
+        adapter = self._get_adapter(provider)
+        url, headers = self._build_request(provider, selected_key)
+        headers["Accept"] = "text/event-stream"
+
+        await self._acquire_slot(provider, selected_key)
+        self.monitor.record_start(provider, selected_key)
+        start_time = time.time()
+        first_token_time = None
+        try:
+            body = adapter.build_stream_body(message, **kwargs)
+            tokens = estimate_tokens(body, adapter.max_tokens(kwargs))
+            await self._throttle(provider, selected_key, tokens)
+            start_time = time.time()
+
+            session = self._get_async_session(provider)
+            async with session.post(url, headers=headers, data=body) as response:
+                response.raise_for_status()
+                parser = SSEParser()
+                async for line in response.content:
+                    event = parser.feed(line)
+                    if event is SSEParser.DONE:
+                        break
+                    if event is None:
+                        continue
+                    delta = adapter.parse_stream_event(event)
+                    if not delta:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        self.monitor.record_first_token(provider, first_token_time)
+                    yield delta
+
+        except Exception as e:
+            logger.error(f"API stream request failed: {str(e) or type(e).__name__}")
+            self._record(provider, selected_key, False, time.time()-start_time, e)
+            raise
+        except (GeneratorExit, asyncio.CancelledError):
+            # 调用方提前结束迭代或任务被取消，只释放 Key 不记录结果
+            self._record_cancelled(provider, selected_key)
+            raise
+
+        self._record(provider, selected_key, True, time.time()-start_time)
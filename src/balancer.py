@@ -1,35 +1,234 @@
-from itertools import cycle
-from typing import Dict, Tuple
+from typing import Dict, List, Optional, Tuple
+import logging
 import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """单个 Key 的熔断器：连续失败或鉴权/限流错误时熔断，冷却后以半开探测恢复"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    TRIP_STATUS = (401, 403, 429)
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def available(self, now: float) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now - self.opened_at >= self.reset_timeout
+        return self.probes < self.half_open_max
+
+    def on_acquire(self, now: float):
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.probes = 0
+        if self.state == self.HALF_OPEN:
+            self.probes += 1
+
+    def on_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probes = 0
+
+    def on_failure(self, now: float, status: Optional[int] = None):
+        self.failures += 1
+        if (self.state == self.HALF_OPEN
+                or status in self.TRIP_STATUS
+                or self.failures >= self.failure_threshold):
+            self.state = self.OPEN
+            self.opened_at = now
+            self.probes = 0
+
+class KeyState:
+    __slots__ = ('key', 'weight', 'current_weight', 'outstanding', 'ewma', 'breaker')
+
+    def __init__(self, key: str, weight: int, breaker: CircuitBreaker):
+        self.key = key
+        self.weight = weight
+        self.current_weight = 0
+        self.outstanding = 0
+        self.ewma = 0.0  # 0 表示尚无观测
+        self.breaker = breaker
+
+    def load(self) -> float:
+        """P2C 比较用的负载：EWMA 延迟乘以 (在途请求数 + 1)"""
+        return self.ewma * (self.outstanding + 1)
+
+class RoundRobinStrategy:
+    def __init__(self):
+        self.position = None
+
+    def select(self, states: List[KeyState], candidates: List[KeyState]) -> KeyState:
+        if self.position is None:
+            self.position = random.randrange(len(states))
+        for _ in range(len(states)):
+            state = states[self.position % len(states)]
+            self.position += 1
+            if state in candidates:
+                return state
+        return candidates[0]
+
+class WeightedRoundRobinStrategy:
+    """平滑加权轮询 (nginx 算法)，权重来自供应商配置中的 weights"""
+
+    def select(self, states: List[KeyState], candidates: List[KeyState]) -> KeyState:
+        total = 0
+        best = None
+        for state in candidates:
+            state.current_weight += state.weight
+            total += state.weight
+            if best is None or state.current_weight > best.current_weight:
+                best = state
+        best.current_weight -= total
+        return best
+
+class LeastOutstandingStrategy:
+    def select(self, states: List[KeyState], candidates: List[KeyState]) -> KeyState:
+        least = min(state.outstanding for state in candidates)
+        return random.choice([state for state in candidates if state.outstanding == least])
+
+class P2CEWMAStrategy:
+    """随机取两个候选，选择 EWMA 延迟加权负载较低者"""
+
+    def select(self, states: List[KeyState], candidates: List[KeyState]) -> KeyState:
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if first.load() <= second.load() else second
+
+STRATEGY_MAP = {
+    "round_robin": RoundRobinStrategy,
+    "weighted_round_robin": WeightedRoundRobinStrategy,
+    "least_outstanding": LeastOutstandingStrategy,
+    "p2c_ewma": P2CEWMAStrategy,
+}
 
 class LoadBalancer:
-    def __init__(self, providers: Dict):
+    def __init__(self, providers: Dict, options: Optional[Dict] = None):
         self.providers = providers
-        self.keys_cycle = {}
-        self._init_cycles()
-    
-    def _init_cycles(self):
+        self.options = options or {}
+        self.ewma_alpha = self.options.get('ewma_alpha', 0.3)
+        self.key_states = {}
+        self.strategies = {}
+        self._lock = threading.Lock()
+        self._init_states()
+
+    def _init_states(self):
         for provider, config in self.providers.items():
             keys = config['keys']
-            random.shuffle(keys)
-            self.keys_cycle[provider] = cycle(keys)
-    
-    def get_next_key(self, provider: str) -> Tuple[str, str]:
-        """返回 (provider_name, api_key)"""
+            weights = config.get('weights') or [1] * len(keys)
+            if len(weights) != len(keys):
+                raise ValueError(f"Provider {provider} weights must match keys")
+            breaker_config = {**self.options.get('breaker', {}), **config.get('breaker', {})}
+            self.key_states[provider] = [
+                KeyState(key, weight, CircuitBreaker(**breaker_config))
+                for key, weight in zip(keys, weights)
+            ]
+            strategy = config.get('strategy', self.options.get('strategy', 'round_robin'))
+            if strategy not in STRATEGY_MAP:
+                raise ValueError(f"Unknown load balancing strategy {strategy}")
+            self.strategies[provider] = STRATEGY_MAP[strategy]()
+
+    def _find_state(self, provider: str, api_key: str) -> Optional[KeyState]:
+        for state in self.key_states.get(provider, []):
+            if state.key == api_key:
+                return state
+        return None
+
+    def _acquire(self, state: KeyState, now: float):
+        state.breaker.on_acquire(now)
+        state.outstanding += 1
+
+    def get_next_key(self, provider: str, exclude: Tuple[str, ...] = ()) -> Tuple[str, str]:
+        """返回 (provider_name, api_key)，调用方完成请求后需调用 release"""
         if provider not in self.providers:
             raise ValueError(f"Provider {provider} not configured")
-        return (provider, next(self.keys_cycle[provider]))
-    
+        with self._lock:
+            now = time.time()
+            states = self.key_states[provider]
+            available = [state for state in states if state.breaker.available(now)]
+            candidates = [state for state in available if state.key not in exclude] or available
+            if not candidates:
+                # 全部熔断时退化为最早熔断的 Key，避免请求直接失败
+                candidates = [min(states, key=lambda state: state.breaker.opened_at)]
+                logger.warning(f"All keys of provider {provider} are unavailable, "
+                               f"falling back to the earliest tripped key")
+            state = self.strategies[provider].select(states, candidates)
+            self._acquire(state, now)
+        return (provider, state.key)
+
     def get_specific_key(self, provider: str, key_index: int = 0) -> Tuple[str, str]:
         """获取指定供应商的特定索引的Key"""
         if provider not in self.providers:
             raise ValueError(f"Provider {provider} not configured")
-        
+
         keys = self.providers[provider]['keys']
         if key_index >= len(keys):
             raise IndexError(f"Provider {provider} only has {len(keys)} keys available")
-            
+
+        with self._lock:
+            self._acquire(self.key_states[provider][key_index], time.time())
         return (provider, keys[key_index])
-    
+
+    def acquire(self, provider: str, api_key: str):
+        """登记调用方直接指定的 Key，与 get_next_key 一样需要 release"""
+        with self._lock:
+            state = self._find_state(provider, api_key)
+            if state is not None:
+                self._acquire(state, time.time())
+
+    def release(self, provider: str, api_key: str, success: Optional[bool],
+                latency: Optional[float] = None, status: Optional[int] = None):
+        """回报请求结果，更新在途数、EWMA 延迟与熔断状态；success 为 None 表示请求被取消"""
+        with self._lock:
+            state = self._find_state(provider, api_key)
+            if state is None:
+                return
+            state.outstanding = max(state.outstanding - 1, 0)
+            if latency is not None:
+                state.ewma = latency if state.ewma == 0 else (
+                    self.ewma_alpha * latency + (1 - self.ewma_alpha) * state.ewma)
+            if success is None:
+                if state.breaker.state == CircuitBreaker.HALF_OPEN:
+                    state.breaker.probes = max(state.breaker.probes - 1, 0)
+            elif success:
+                state.breaker.on_success()
+            else:
+                state.breaker.on_failure(time.time(), status)
+                if state.breaker.state == CircuitBreaker.OPEN:
+                    logger.warning(f"Key {api_key[:6]}*** of provider {provider} ejected (status={status})")
+
+    def healthy_providers(self) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [provider for provider, states in self.key_states.items()
+                    if any(state.breaker.available(now) for state in states)]
+
+    def select_provider(self) -> str:
+        """在健康供应商中按 P2C-EWMA 选择"""
+        providers = self.healthy_providers() or list(self.providers.keys())
+        if len(providers) == 1:
+            return providers[0]
+        with self._lock:
+            def load(provider):
+                states = self.key_states[provider]
+                observed = [state.ewma for state in states if state.ewma > 0]
+                ewma = sum(observed) / len(observed) if observed else 0.0
+                return ewma * (sum(state.outstanding for state in states) + 1)
+            first, second = random.sample(providers, 2)
+            return first if load(first) <= load(second) else second
+
     def get_random_provider(self):
-        return random.choice(list(self.providers.keys()))
\ No newline at end of file
+        return random.choice(self.healthy_providers() or list(self.providers.keys()))
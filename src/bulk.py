@@ -0,0 +1,226 @@
+import time
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .adapters.base import dumps_bytes, loads_bytes
+
+logger = logging.getLogger(__name__)
+
+class OpenAIBatchBackend:
+    """OpenAI Batch API：上传 JSONL 输入文件 -> 创建 batch -> 轮询 -> 下载输出文件"""
+    TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(self, client, provider: str):
+        self.client = client
+        self.provider = provider
+        self.base_url = client.balancer.providers[provider]['base_url']
+
+    def _headers(self, api_key: str) -> Dict:
+        return {"Authorization": f"Bearer {api_key}"}
+
+    def submit(self, api_key: str, lines: List[dict]) -> str:
+        session = self.client._get_session(self.provider)
+        timeout = self.client._get_timeout(self.provider)
+        content = b"".join(dumps_bytes(line) + b"\n" for line in lines)
+        response = session.post(f"{self.base_url}/files", headers=self._headers(api_key),
+                                files={"file": ("batch.jsonl", content, "application/jsonl")},
+                                data={"purpose": "batch"}, timeout=timeout)
+        response.raise_for_status()
+        response = session.post(f"{self.base_url}/batches", headers=self._headers(api_key), json={
+            "input_file_id": response.json()["id"],
+            "endpoint": lines[0]["url"],
+            "completion_window": "24h",
+        }, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def poll(self, api_key: str, batch_id: str) -> Tuple[bool, dict]:
+        """返回 (是否结束, 任务信息)"""
+        response = self.client._get_session(self.provider).get(
+            f"{self.base_url}/batches/{batch_id}", headers=self._headers(api_key),
+            timeout=self.client._get_timeout(self.provider))
+        response.raise_for_status()
+        info = response.json()
+        return info["status"] in self.TERMINAL, info
+
+    def iter_output(self, api_key: str, info: dict) -> Iterator[dict]:
+        # 成功与失败的请求分别写入 output_file_id 与 error_file_id
+        for file_id in (info.get("output_file_id"), info.get("error_file_id")):
+            if file_id:
+                yield from _iter_jsonl(self.client, self.provider, f"{self.base_url}/files/{file_id}/content",
+                                       self._headers(api_key))
+
+class AnthropicBatchBackend:
+    """Anthropic Message Batches：创建 batch -> 轮询 -> 读取 results_url"""
+
+    def __init__(self, client, provider: str):
+        self.client = client
+        self.provider = provider
+        self.base_url = client.balancer.providers[provider]['base_url']
+
+    def _headers(self, api_key: str) -> Dict:
+        url, headers = self.client._build_request(self.provider, api_key)
+        return headers
+
+    def submit(self, api_key: str, lines: List[dict]) -> str:
+        response = self.client._get_session(self.provider).post(
+            f"{self.base_url}/messages/batches", headers=self._headers(api_key),
+            data=dumps_bytes({"requests": lines}), timeout=self.client._get_timeout(self.provider))
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def poll(self, api_key: str, batch_id: str) -> Tuple[bool, dict]:
+        response = self.client._get_session(self.provider).get(
+            f"{self.base_url}/messages/batches/{batch_id}", headers=self._headers(api_key),
+            timeout=self.client._get_timeout(self.provider))
+        response.raise_for_status()
+        info = response.json()
+        return info["processing_status"] == "ended", info
+
+    def iter_output(self, api_key: str, info: dict) -> Iterator[dict]:
+        if info.get("results_url"):
+            yield from _iter_jsonl(self.client, self.provider, info["results_url"], self._headers(api_key))
+
+def _iter_jsonl(client, provider: str, url: str, headers: Dict) -> Iterator[dict]:
+    """流式下载 JSONL 结果，逐行解析而不把整个文件读入内存"""
+    with client._get_session(provider).get(url, headers=headers, stream=True,
+                                           timeout=client._get_timeout(provider)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield loads_bytes(line)
+
+BATCH_BACKENDS = {
+    "openai": OpenAIBatchBackend,
+    "anthropic": AnthropicBatchBackend,
+}
+
+@dataclass
+class BulkJob:
+    provider: str
+    api_key: str
+    batch_id: str
+    requests: Dict[str, List[int]]
+    submitted_at: float = field(default_factory=time.time)
+    status: Optional[str] = None
+    info: Dict = field(default_factory=dict)
+
+class BulkCoordinator:
+    """
+    离线批量模式：消息经供应商的异步批量接口提交，轮询完成后按 custom_id 拆分结果
+
+    与 RequestCoordinator 的 batch_request 接口一致；命中缓存的消息不再提交，
+    相同消息只提交一次，结果写入 MessageCache 并计入 PerformanceMonitor
+    （记在 `{provider}:batch` 名下，不影响在线请求的延迟统计）
+    """
+
+    def __init__(self, client, poll_interval: float = 30.0, max_batch_size: int = 10000,
+                 max_wait: float = 24 * 3600):
+        self.client = client
+        self.poll_interval = poll_interval
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+    @classmethod
+    def from_config(cls, client, config):
+        options = config.api_config.get('bulk', {})
+        return cls(client,
+                   poll_interval=options.get('poll_interval', 30.0),
+                   max_batch_size=options.get('max_batch_size', 10000),
+                   max_wait=options.get('max_wait', 24 * 3600))
+
+    def _backend(self, provider: str):
+        backend_class = BATCH_BACKENDS.get(provider)
+        if backend_class is None:
+            raise ValueError(f"Provider {provider} does not support batch requests")
+        return backend_class(self.client, provider)
+
+    def submit(self, messages: List[Tuple[int, str]], provider: str, api_key: Optional[str] = None,
+               key_index: Optional[int] = None, stage: Optional[str] = None, **kwargs) -> BulkJob:
+        """提交一个批量任务，messages 为 (输入序号, 消息)；stage 只参与缓存键，不写入请求体"""
+        # 先确认供应商支持批量接口，再构建请求行
+        backend = self._backend(provider)
+        adapter = self.client._get_adapter(provider)
+        requests, lines = {}, []
+        for index, message in messages:
+            custom_id = self.client._cache_key(provider, message, kwargs, stage=stage,
+                                               api_key=api_key, key_index=key_index)
+            if custom_id not in requests:
+                requests[custom_id] = []
+                lines.append(adapter.batch_request_line(custom_id, message, **kwargs))
+            requests[custom_id].append(index)
+        provider, selected_key = self.client._select_key(provider, api_key, key_index)
+        try:
+            batch_id = backend.submit(selected_key, lines)
+        finally:
+            # 批量任务不占用在线请求的并发额度
+            self.client.balancer.release(provider, selected_key, None)
+        logger.info(f"Submitted {provider} batch {batch_id} with {len(lines)} requests")
+        return BulkJob(provider, selected_key, batch_id, requests)
+
+    def wait(self, job: BulkJob) -> BulkJob:
+        """轮询直到任务结束或超过 max_wait"""
+        backend = self._backend(job.provider)
+        while True:
+            done, job.info = backend.poll(job.api_key, job.batch_id)
+            job.status = job.info.get("status") or job.info.get("processing_status")
+            if done:
+                return job
+            if time.time() - job.submitted_at >= self.max_wait:
+                raise TimeoutError(f"Batch {job.batch_id} did not finish within {self.max_wait}s")
+            time.sleep(self.poll_interval)
+
+    def iter_results(self, job: BulkJob) -> Iterator[Tuple[int, Dict]]:
+        """流式读取已结束任务的结果，产出 (输入序号, 结果)"""
+        provider = job.provider
+        adapter = self.client._get_adapter(provider)
+        monitor = self.client.monitor
+        label = f"{provider}:batch"
+        elapsed = time.time() - job.submitted_at
+        remaining = dict(job.requests)
+        for line in self._backend(provider).iter_output(job.api_key, job.info):
+            custom_id, body, error = adapter.parse_batch_result(line)
+            indices = remaining.pop(custom_id, None)
+            if indices is None:
+                continue
+            if error is None:
+                result = self.client._success_result(provider, adapter.parse_response(body), body)
+                self.client.cache.set(custom_id, result)
+            else:
+                result = self.client._error_result(provider, RuntimeError(error))
+            monitor.record_request(label, error is None, elapsed)
+            for index in indices:
+                yield index, result
+        for indices in remaining.values():
+            result = self.client._error_result(
+                provider, RuntimeError(f"Missing from batch {job.batch_id} output ({job.status})"))
+            monitor.record_request(label, False, elapsed)
+            for index in indices:
+                yield index, result
+
+    def batch_request(
+        self,
+        messages: Iterable[str],
+        provider: Optional[str] = None,
+        api_key: Optional[str] = None,
+        key_index: Optional[int] = None,
+        stage: Optional[str] = None,
+        **kwargs
+    ) -> List[Dict]:
+        """执行整批请求，按输入顺序返回结果；与在线请求共用缓存键（包括 description 阶段的规范化）"""
+        provider = self.client._resolve_provider(provider, api_key)
+        results, pending = {}, []
+        for index, message in enumerate(messages):
+            cached = self.client.cache.get(self.client._cache_key(provider, message, kwargs, stage=stage,
+                                                                  api_key=api_key, key_index=key_index))
+            self.client.monitor.record_cache(provider, cached is not None, stage)
+            if cached:
+                results[index] = cached
+            else:
+                pending.append((index, message))
+        jobs = [self.submit(pending[i:i + self.max_batch_size], provider, api_key, key_index, stage, **kwargs)
+                for i in range(0, len(pending), self.max_batch_size)]
+        for job in jobs:
+            self.wait(job)
+            results.update(self.iter_results(job))
+        return [results[index] for index in range(len(results))]
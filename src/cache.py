@@ -1,27 +1,235 @@
+import json
 import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
 from collections import OrderedDict
+from .result import RequestResult
+
+class DiskCache:
+    """基于 SQLite (WAL) 的二级缓存，进程重启后仍有效，可被同机多个进程共享"""
+
+    def __init__(self, path, ttl=7 * 24 * 3600, max_bytes=512 * 1024 * 1024, evict_interval=100):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evict_interval = evict_interval
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 连接不能跨线程共享，每个线程持有自己的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        now = time.time()
+        if now - created >= self.ttl:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return RequestResult.from_dict(json.loads(value))
+
+    def set(self, key, response):
+        if isinstance(response, RequestResult):
+            response = response.to_dict()
+        value = json.dumps(response, ensure_ascii=False, default=str).encode('utf-8')
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, value, len(value), now, now)
+        )
+        with self._lock:
+            self._writes += 1
+            should_evict = self._writes % self.evict_interval == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并按最近访问时间淘汰超出 max_bytes 的部分"""
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE created <= ?", (time.time() - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total > self.max_bytes:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS running FROM cache) "
+                "WHERE running > ?)",
+                (self.max_bytes,)
+            )
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+def result_size(response) -> int:
+    """估算缓存条目占用的字节数"""
+    if isinstance(response, RequestResult):
+        return response.nbytes
+    return len(json.dumps(response, ensure_ascii=False, default=str).encode('utf-8'))
 
 class MessageCache:
-    def __init__(self, ttl=300, max_size=1000):
+    """
+    内存 LRU 缓存，同时受条目数 max_size 与总字节数 max_bytes 限制
+
+    超过 max_entry_bytes（默认 max_bytes 的 1/16）的大结果不进入内存，只写磁盘缓存，
+    避免少量长回答挤掉大量短回答
+    """
+
+    def __init__(self, ttl=300, max_size=1000, disk=None, max_bytes=None, max_entry_bytes=None):
         self.ttl = ttl
         self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else (
+            max_bytes // 16 if max_bytes else None)
+        self.disk = disk
         self.cache = OrderedDict()
-    
-    def get(self, message):
-        if message in self.cache:
-            entry = self.cache[message]
-            if (time.time() - entry['timestamp']) < self.ttl:
-                self.cache.move_to_end(message)
-                return entry['response']
-            else:
-                del self.cache[message]
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(provider, params, kwargs, message, api_key=None):
+        """
+        由供应商、模型/固定参数、调用参数和消息共同决定缓存键；
+        请求固定使用某个 Key 时（Dify 的 Key 对应不同应用）键中加入该 Key 的哈希
+        """
+        parts = [provider, params, kwargs, message]
+        if api_key is not None:
+            parts.append(hashlib.sha256(api_key.encode('utf-8')).hexdigest())
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self.cache:
+                timestamp, size, response = self.cache[key]
+                if (time.time() - timestamp) < self.ttl:
+                    self.cache.move_to_end(key)
+                    return response
+                else:
+                    del self.cache[key]
+                    self.total_bytes -= size
+        if self.disk is not None:
+            response = self.disk.get(key)
+            if response is not None:
+                self._set_memory(key, response)
+                return response
         return None
-    
-    def set(self, message, response):
-        if len(self.cache) >= self.max_size:
-            self.cache.popitem(last=False)
-        self.cache[message] = {
-            'timestamp': time.time(),
-            'response': response
-        }
-        # Remove oldest entries if cache exceeds size (optional)
\ No newline at end of file
+
+    def set(self, key, response):
+        self._set_memory(key, response)
+        if self.disk is not None:
+            self.disk.set(key, response)
+
+    def _set_memory(self, key, response):
+        size = result_size(response) if self.max_bytes or self.max_entry_bytes else 0
+        with self._lock:
+            old = self.cache.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            if self.max_entry_bytes and size > self.max_entry_bytes:
+                return
+            self.cache[key] = (time.time(), size, response)
+            self.total_bytes += size
+            while len(self.cache) > self.max_size or (self.max_bytes and self.total_bytes > self.max_bytes):
+                _, (_, evicted, _) = self.cache.popitem(last=False)
+                self.total_bytes -= evicted
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """同一键的并发调用只执行一次，其余调用方等待并共享首个调用的结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """返回 (result, shared)，shared 表示结果来自其他调用方"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result, False
+
+_RETRY = object()
+
+class AsyncSingleFlight:
+    """
+    SingleFlight 的 asyncio 版本，只能在单个事件循环内使用
+
+    领头方被取消时不取消共享的 future，等待方收到 _RETRY 后重新竞争执行，
+    一个调用方超时或提前退出不会让同键的其他请求失败
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, coro_fn):
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                break
+            result = await asyncio.shield(future)
+            if result is not _RETRY:
+                return result, True
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            future.set_result(_RETRY)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # 无等待方时避免 "exception was never retrieved"
+            raise
+        finally:
+            del self._calls[key]
+        future.set_result(result)
+        return result, False
@@ -0,0 +1,155 @@
+import re
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+_FIELD_LINE = re.compile(r'^([^:：\n]{1,64})[:：][ \t]*(.*)$')
+_WHITESPACE = re.compile(r'\s+')
+
+DEFAULT_PLACEHOLDERS = ("none", "nan", "nat", "null", "", "-", "暂无", "无")
+
+class MessageCanonicalizer:
+    """
+    将 `列名: 值` 形式的消息规范化后再计算缓存键
+
+    全角转半角、合并空白，占位值（None/nan/空等）视为缺失字段，去掉易变列，按列名排序；
+    不是 `列名: 值` 形式的消息只做空白规范化。
+    只作用于 stages 中的阶段（默认只有由表格行生成的 description），
+    其余提示词中的行顺序与 `无`/`-` 等取值有含义，按原文计算缓存键
+    """
+
+    def __init__(self, ignored_columns: Iterable[str] = (), placeholders: Iterable[str] = DEFAULT_PLACEHOLDERS,
+                 sort_fields: bool = True, stages: Iterable[str] = ("description",)):
+        self.ignored_columns = {self._normalize(col) for col in ignored_columns}
+        self.placeholders = {placeholder.lower() for placeholder in placeholders}
+        self.sort_fields = sort_fields
+        self.stages = set(stages)
+
+    @classmethod
+    def from_config(cls, options: Optional[Dict]):
+        if not options or not options.get('enabled', True):
+            return None
+        return cls(options.get('ignored_columns', ()),
+                   options.get('placeholders', DEFAULT_PLACEHOLDERS),
+                   options.get('sort_fields', True),
+                   options.get('stages', ("description",)))
+
+    def applies_to(self, stage: Optional[str]) -> bool:
+        return stage in self.stages
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+    def parse(self, message: str) -> Optional[Dict[str, str]]:
+        """
+        解析为 {列名: 值}，不以 `列名:` 开头的行视为上一列的续行；
+        没有可识别的列或列名重复时返回 None，避免不同消息规范化后相同
+        """
+        fields = {}
+        column = None
+        for line in message.splitlines():
+            match = _FIELD_LINE.match(line)
+            if match:
+                column = self._normalize(match.group(1))
+                if column in fields:
+                    return None
+                fields[column] = match.group(2)
+            elif column is not None:
+                fields[column] += "\n" + line
+            elif line.strip():
+                return None
+        return fields or None
+
+    def canonicalize(self, message: str) -> str:
+        fields = self.parse(message)
+        if fields is None:
+            return self._normalize(message)
+        items = []
+        for column, value in fields.items():
+            if column in self.ignored_columns:
+                continue
+            value = self._normalize(value)
+            if value.lower() in self.placeholders:
+                continue
+            items.append((column, value))
+        if self.sort_fields:
+            items.sort()
+        return "\n".join(f"{column}: {value}" for column, value in items)
+
+_BITS = np.arange(64, dtype=np.uint64)
+_POWERS = np.left_shift(np.uint64(1), _BITS)
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64 位 SimHash，特征为字符 n-gram 及其出现次数"""
+    if len(text) <= shingle:
+        features = Counter([text])
+    else:
+        features = Counter(text[i:i + shingle] for i in range(len(text) - shingle + 1))
+    hashes = np.fromiter((_feature_hash(feature) for feature in features), dtype=np.uint64, count=len(features))
+    counts = np.fromiter(features.values(), dtype=np.int64, count=len(features))
+    # 每个特征的 64 位展开为 ±1 矩阵，按出现次数加权求和得到各位的权重
+    bits = (hashes[:, None] >> _BITS & np.uint64(1)).astype(np.int64)
+    weights = counts @ (2 * bits - 1)
+    return int((weights > 0).astype(np.uint64) @ _POWERS)
+
+class SimHashIndex:
+    """
+    SimHash 近似重复索引
+
+    指纹切分为 max_distance + 1 段，汉明距离不超过 max_distance 的两个指纹至少有一段完全相同，
+    查询只比较同段桶内的候选。scope 区分供应商与调用参数，不同 scope 之间不匹配。
+    索引只在内存中，超过 max_entries 时淘汰最早加入的条目
+    """
+
+    def __init__(self, max_distance: int = 3, max_entries: int = 100000):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.buckets: Dict[Tuple, set] = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, scope: str, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        return [(scope, band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def add(self, key: str, fingerprint: int, scope: str = ""):
+        """fingerprint 为 simhash(text)，由调用方在查询时计算一次后复用"""
+        with self._lock:
+            if key in self.entries:
+                return
+            self.entries[key] = (scope, fingerprint)
+            for band_key in self._band_keys(scope, fingerprint):
+                self.buckets.setdefault(band_key, set()).add(key)
+            if len(self.entries) > self.max_entries:
+                old_key, (old_scope, old_fingerprint) = self.entries.popitem(last=False)
+                for band_key in self._band_keys(old_scope, old_fingerprint):
+                    bucket = self.buckets.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(old_key)
+                        if not bucket:
+                            del self.buckets[band_key]
+
+    def query(self, fingerprint: int, scope: str = "", exclude: Optional[str] = None) -> Optional[Tuple[str, int]]:
+        """返回与指纹汉明距离最小且不超过 max_distance 的 (key, 距离)，没有时返回 None"""
+        best = None
+        with self._lock:
+            for band_key in self._band_keys(scope, fingerprint):
+                for key in self.buckets.get(band_key, ()):
+                    if key == exclude:
+                        continue
+                    distance = bin(fingerprint ^ self.entries[key][1]).count("1")
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (key, distance)
+        return best
+
+    def __len__(self) -> int:
+        return len(self.entries)
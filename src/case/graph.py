@@ -0,0 +1,153 @@
+import json
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+from .models import CaseData
+
+Entity = Tuple[str, str]
+
+EMPTY_VALUES = {"", "暂无", "无", "未知", "none", "null"}
+_NOISE = re.compile(r"[\s,，.。;；:：、()（）\-_#/]+")
+
+# 共享实体的权重：证件号、手机号几乎唯一，姓名与地址只作弱关联
+ENTITY_WEIGHTS = {
+    "id_card": 4.0,
+    "phone": 3.0,
+    "location": 2.0,
+    "address": 1.5,
+    "name": 1.0,
+}
+
+def normalize(value) -> str:
+    """全角转半角、去掉空白与常见标点并转为小写"""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value))
+    return _NOISE.sub("", text).lower()
+
+def _as_dict(case: Union[CaseData, Dict]) -> Dict:
+    return case.model_dump() if isinstance(case, CaseData) else case
+
+def extract_entities(case: Union[CaseData, Dict]) -> Set[Entity]:
+    """从案件中提取人员（证件号/手机号/姓名）与地点（LocationInfo/AddressInfo）实体"""
+    case = _as_dict(case)
+    entities = set()
+    details = case.get("details") or {}
+    for person in (details.get("subject") or []) + (details.get("object") or []):
+        for kind in ("id_card", "phone", "name"):
+            value = normalize(person.get(kind))
+            if value not in EMPTY_VALUES:
+                entities.add((kind, value.upper() if kind == "id_card" else value))
+    location = case.get("location") or {}
+    parts = [normalize(location.get(field)) for field in ("province", "city", "district", "street", "detail")]
+    if parts[-1] not in EMPTY_VALUES:
+        entities.add(("location", "".join(parts)))
+    for address in (case.get("elements") or {}).get("addresses") or []:
+        value = normalize(address.get("full_address"))
+        if value not in EMPTY_VALUES:
+            entities.add(("address", value))
+    return entities
+
+class EntityIndex:
+    """
+    案件实体倒排索引：实体 -> 案件 id 集合，案件 id -> 实体集合
+
+    增量写入，查询关联案件的代价与共享实体的度数成正比；给出 path 时以 JSONL 日志持久化，
+    加载时按顺序回放，同一案件以最后一次写入为准
+    """
+
+    def __init__(self, path=None, max_degree: int = 1000):
+        self.path = Path(path) if path else None
+        self.max_degree = max_degree
+        self.entity_cases: Dict[Entity, Set[str]] = {}
+        self.case_entities: Dict[str, Set[Entity]] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._link(entry["case"], {tuple(entity) for entity in entry["entities"]})
+
+    def _link(self, case_id: str, entities: Set[Entity]):
+        for entity in self.case_entities.get(case_id, set()) - entities:
+            cases = self.entity_cases.get(entity)
+            if cases is not None:
+                cases.discard(case_id)
+                if not cases:
+                    del self.entity_cases[entity]
+        for entity in entities:
+            self.entity_cases.setdefault(entity, set()).add(case_id)
+        self.case_entities[case_id] = entities
+
+    def add_case(self, case: Union[CaseData, Dict]) -> Set[Entity]:
+        """写入或更新一个案件的实体关联"""
+        case = _as_dict(case)
+        entities = extract_entities(case)
+        with self._lock:
+            if self.case_entities.get(case["id"]) == entities:
+                return entities
+            self._link(case["id"], entities)
+            if self._file is not None:
+                self._file.write(json.dumps({"case": case["id"], "entities": sorted(entities)},
+                                            ensure_ascii=False) + "\n")
+                self._file.flush()
+        return entities
+
+    def rebuild(self, cases: Iterable[Union[CaseData, Dict]]) -> int:
+        """从已有案件（例如 CaseStorage.iter_cases(raw=True)）重建索引"""
+        count = 0
+        for case in cases:
+            self.add_case(case)
+            count += 1
+        return count
+
+    def related_cases(self, case: Union[CaseData, Dict], limit: Optional[int] = None,
+                      kinds: Optional[Iterable[str]] = None) -> List[Tuple[str, float, List[Entity]]]:
+        """
+        查找与案件共享实体的已有案件，按共享实体的权重之和降序返回 (案件 id, 得分, 共享实体)
+
+        度数超过 max_degree 的实体（例如常见姓名）视为噪声，不参与关联
+        """
+        case = _as_dict(case)
+        kinds = set(kinds) if kinds else None
+        scores = Counter()
+        shared: Dict[str, List[Entity]] = {}
+        with self._lock:
+            for entity in extract_entities(case):
+                if kinds is not None and entity[0] not in kinds:
+                    continue
+                cases = self.entity_cases.get(entity, ())
+                if len(cases) > self.max_degree:
+                    continue
+                for other in cases:
+                    if other == case["id"]:
+                        continue
+                    scores[other] += ENTITY_WEIGHTS.get(entity[0], 1.0)
+                    shared.setdefault(other, []).append(entity)
+        return [(other, score, sorted(shared[other])) for other, score in scores.most_common(limit)]
+
+    def __contains__(self, case_id: str) -> bool:
+        return case_id in self.case_entities
+
+    def __len__(self) -> int:
+        return len(self.case_entities)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
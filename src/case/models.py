@@ -3,6 +3,9 @@ from typing import List, Dict, Optional, Union
 from pydantic import BaseModel, field_validator, Field, model_validator
 import re
 
+PHONE_PATTERN = re.compile(r'^1[3-9]\d{9}$')
+ID_CARD_PATTERN = re.compile(r'^\d{17}[\dXx]$')
+
 class TimeInfo(BaseModel):
     occur_time: str
     processing_time: str
@@ -13,7 +16,7 @@ class TimeInfo(BaseModel):
         try:
             datetime.strptime(v, "%Y-%m-%d %H:%M")
             return v
-        except ValueError:
+        except (TypeError, ValueError):
             raise ValueError("时间格式必须为 YYYY-MM-DD HH:MM")
 
 class LocationInfo(BaseModel):
@@ -33,7 +36,7 @@ class SubjectInfo(BaseModel):
     def validate_phone(cls, v):
         if v in ["暂无", None]:
             return "暂无"
-        if not re.match(r'^1[3-9]\d{9}$', v):
+        if not isinstance(v, str) or not PHONE_PATTERN.match(v):
             raise ValueError('手机号格式无效')
         return v
     
@@ -41,7 +44,7 @@ class SubjectInfo(BaseModel):
     def validate_id_card(cls, v):
         if v in ["暂无", None]:
             return "暂无"
-        if not re.match(r'^\d{17}[\dXx]$', v):
+        if not isinstance(v, str) or not ID_CARD_PATTERN.match(v):
             raise ValueError('身份证号格式无效')
         return v
 
@@ -121,9 +124,12 @@ class CaseData(BaseModel):
 
     @model_validator(mode='before')
     def set_defaults(cls, values):
-        # 确保嵌套字段都有默认值
+        # 确保嵌套字段都有默认值，非字典输入交由字段校验报错
+        if not isinstance(values, dict):
+            return values
         if 'relationships' not in values:
             values['relationships'] = {}
-        if 'special_flags' not in values.get('elements', {}):
-            values['elements']['special_flags'] = {}
+        elements = values.get('elements')
+        if isinstance(elements, dict) and 'special_flags' not in elements:
+            elements['special_flags'] = {}
         return values
\ No newline at end of file
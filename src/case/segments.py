@@ -0,0 +1,191 @@
+import json
+import mmap
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+class SegmentStore:
+    """
+    追加写入的分段记录存储
+
+    每条记录是一行紧凑 JSON，写入当前段文件，段文件超过 segment_max_bytes 时轮转；
+    index.jsonl 记录 id -> (段号, 偏移, 长度)，同一 id 以最后一次写入为准。
+    写入先进入缓冲区，按条数或时间间隔批量落盘，读取通过 mmap 按偏移切片
+    """
+
+    INDEX_FILE = "index.jsonl"
+
+    def __init__(self, path, segment_max_bytes: int = 64 * 1024 * 1024,
+                 flush_every: int = 100, flush_interval: float = 1.0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = segment_max_bytes
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self._lock = threading.RLock()
+        self._buffer: List[Tuple[str, int, int, bytes]] = []
+        # 尚未落盘的记录按 id 保存最新一行，读取时直接从内存返回
+        self._pending: Dict[str, bytes] = {}
+        self._last_flush = time.monotonic()
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._load()
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / f"segment_{segment:06d}.jsonl"
+
+    def _load(self):
+        segments = sorted(int(p.stem.split("_")[1]) for p in self.path.glob("segment_*.jsonl"))
+        self.segment = segments[-1] if segments else 1
+        index_path = self.path / self.INDEX_FILE
+        if index_path.exists():
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.index[entry["id"]] = (entry["segment"], entry["offset"], entry["length"])
+        segment_path = self._segment_path(self.segment)
+        self.size = segment_path.stat().st_size if segment_path.exists() else 0
+        self._recover()
+        self._index_file = open(index_path, 'a', encoding='utf-8')
+
+    def _recover(self):
+        # 段文件已落盘但索引未写入的尾部记录：从已索引的末尾扫描补齐，截断写了一半的末行
+        indexed_end = max((offset + length for segment, offset, length in self.index.values()
+                           if segment == self.segment), default=0)
+        if indexed_end >= self.size:
+            return
+        segment_path = self._segment_path(self.segment)
+        recovered = []
+        with open(segment_path, 'rb') as f:
+            f.seek(indexed_end)
+            offset = indexed_end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record_id = json.loads(line)["id"]
+                except (json.JSONDecodeError, KeyError):
+                    break
+                recovered.append((record_id, self.segment, offset, len(line)))
+                offset += len(line)
+        if offset < self.size:
+            os.truncate(segment_path, offset)
+            self.size = offset
+        if recovered:
+            with open(self.path / self.INDEX_FILE, 'a', encoding='utf-8') as f:
+                for record_id, segment, offset, length in recovered:
+                    self.index[record_id] = (segment, offset, length)
+                    f.write(self._index_line(record_id, segment, offset, length))
+
+    @staticmethod
+    def _index_line(record_id: str, segment: int, offset: int, length: int) -> str:
+        return json.dumps({"id": record_id, "segment": segment, "offset": offset, "length": length},
+                          ensure_ascii=False) + "\n"
+
+    def append(self, record_id: str, data: Dict):
+        """追加一条记录，返回 (段号, 偏移)"""
+        line = json.dumps({"id": record_id, "ts": time.time(), "data": data},
+                          ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8') + b"\n"
+        with self._lock:
+            if self.size and self.size + len(line) > self.segment_max_bytes:
+                self._flush()
+                self.segment += 1
+                self.size = 0
+            location = (self.segment, self.size)
+            self._buffer.append((record_id, self.segment, self.size, line))
+            self._pending[record_id] = line
+            self.index[record_id] = (self.segment, self.size, len(line))
+            self.size += len(line)
+            if (len(self._buffer) >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+            return location
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        # 先写段文件再写索引，崩溃时索引缺失的记录由 _recover 补齐
+        segment = self._buffer[0][1]
+        with open(self._segment_path(segment), 'ab') as f:
+            f.write(b"".join(line for _, _, _, line in self._buffer))
+            f.flush()
+            os.fsync(f.fileno())
+        self._index_file.write("".join(self._index_line(record_id, segment, offset, len(line))
+                                       for record_id, segment, offset, line in self._buffer))
+        self._index_file.flush()
+        self._buffer = []
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _read(self, segment: int, offset: int, length: int) -> bytes:
+        view = self._maps.get(segment)
+        if view is None or offset + length > len(view):
+            if view is not None:
+                view.close()
+            with open(self._segment_path(segment), 'rb') as f:
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = view
+        return view[offset:offset + length]
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        """按 id 读取最新版本，缓冲区中的记录不触发落盘"""
+        with self._lock:
+            line = self._pending.get(record_id)
+            if line is None:
+                location = self.index.get(record_id)
+                if location is None:
+                    return None
+                line = self._read(*location)
+            return json.loads(line)["data"]
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def iter_records(self, latest_only: bool = True) -> Iterator[Tuple[str, Dict]]:
+        """
+        按写入顺序遍历 (id, 记录)；latest_only=False 时包含同一 id 的历史版本
+        """
+        with self._lock:
+            self._flush()
+            latest = set(self.index.values()) if latest_only else None
+            last_segment, last_size = self.segment, self.size
+        for segment in range(1, last_segment + 1):
+            segment_path = self._segment_path(segment)
+            if not segment_path.exists():
+                continue
+            with open(segment_path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    # 只读到快照时已落盘的位置，忽略遍历期间新写入的记录
+                    if segment == last_segment and offset >= last_size:
+                        break
+                    if latest is None or (segment, offset, len(line)) in latest:
+                        record = json.loads(line)
+                        yield record["id"], record["data"]
+                    offset += len(line)
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._index_file.close()
+            for view in self._maps.values():
+                view.close()
+            self._maps = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
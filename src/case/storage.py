@@ -1,46 +1,79 @@
 import json
 from pathlib import Path
-from datetime import datetime
-from typing import Union, Dict
-from case.models import CaseData
-import threading
+from typing import Union, Dict, Iterable, Iterator, List, Optional
+from .models import CaseData
+from .segments import SegmentStore
+from .validation import ValidationReport, validate_case, validate_cases
 
 class CaseStorage:
-    _lock = threading.Lock()
+    """
+    案件存储：记录追加写入分段文件，按案件 id 索引，同一 id 以最新版本为准
+    """
 
-    def __init__(self, storage_path: str = "./case_data"):
+    def __init__(self, storage_path: str = "./case_data", segment_max_bytes: int = 64 * 1024 * 1024,
+                 flush_every: int = 100, flush_interval: float = 1.0,
+                 validation_processes: int = 0, validation_chunk_size: int = 500):
         self.storage_path = Path(storage_path)
         self.storage_path.mkdir(parents=True, exist_ok=True)
-    
-    def _generate_filename(self, case_id: str) -> Path:
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return self.storage_path / f"case_{case_id}_{timestamp}.json"
-    
+        self.store = SegmentStore(self.storage_path, segment_max_bytes, flush_every, flush_interval)
+        self.validation_processes = validation_processes
+        self.validation_chunk_size = validation_chunk_size
+
     def save_case(self, case_data: Union[CaseData, Dict]) -> str:
+        """保存案件并返回案件 id，写入按批落盘"""
         if isinstance(case_data, dict):
             case_data = CaseData(**case_data)
-            
-        filepath = self._generate_filename(case_data.id)
-        
-        with self._lock:  # 添加线程锁
-            try:
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(case_data.dict(), f, ensure_ascii=False, indent=2)
-            except Exception as e:
-                raise IOError(f"文件存储失败: {str(e)}")
-        
-        return str(filepath)
-    
+        try:
+            self.store.append(case_data.id, case_data.model_dump())
+        except Exception as e:
+            raise IOError(f"文件存储失败: {str(e)}")
+        return case_data.id
+
+    def save_cases(self, cases: Iterable[Union[CaseData, Dict]]) -> List[str]:
+        """批量保存案件并立即落盘"""
+        case_ids = [self.save_case(case_data) for case_data in cases]
+        self.store.flush()
+        return case_ids
+
+    def get_case(self, case_id: str, raw: bool = False) -> Optional[Union[CaseData, Dict]]:
+        """按案件 id 读取最新版本，raw=True 时返回字典以跳过模型校验"""
+        data = self.store.get(case_id)
+        if data is None or raw:
+            return data
+        return CaseData(**data)
+
+    def iter_cases(self, latest_only: bool = True, raw: bool = False) -> Iterator[Union[CaseData, Dict]]:
+        """按写入顺序遍历案件，raw=True 时返回字典以跳过模型校验"""
+        for _, data in self.store.iter_records(latest_only):
+            yield data if raw else CaseData(**data)
+
     def load_case(self, filepath: str) -> CaseData:
         """从文件加载案件数据"""
         with open(filepath, 'r', encoding='utf-8') as f:
             data = json.load(f)
         return CaseData(**data)
-    
-    def validate_json(self, json_data: Dict) -> bool:
+
+    def import_files(self, pattern: str = "case_*.json") -> int:
+        """将旧版每案一个 JSON 文件的数据按修改时间顺序导入分段存储"""
+        files = sorted(self.storage_path.glob(pattern), key=lambda p: p.stat().st_mtime)
+        for filepath in files:
+            self.save_case(self.load_case(filepath))
+        self.store.flush()
+        return len(files)
+
+    def flush(self):
+        self.store.flush()
+
+    def close(self):
+        self.store.close()
+
+    def validate_json(self, json_data: Union[str, Dict]) -> bool:
         """验证JSON数据是否符合规范"""
-        try:
-            CaseData(**json_data)
-            return True
-        except Exception:
-            return False
\ No newline at end of file
+        return validate_case(json_data).ok
+
+    def validate_batch(self, items: Iterable[Union[str, Dict]], processes: Optional[int] = None,
+                       chunk_size: Optional[int] = None) -> List[ValidationReport]:
+        """批量验证模型输出，返回包含逐字段错误的报告；进程数与分块大小默认取构造时的配置"""
+        return validate_cases(items,
+                              self.validation_processes if processes is None else processes,
+                              self.validation_chunk_size if chunk_size is None else chunk_size)
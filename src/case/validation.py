@@ -0,0 +1,144 @@
+import json
+import re
+import concurrent.futures
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Union
+from pydantic import TypeAdapter, ValidationError
+from .models import CaseData
+
+_FENCE = re.compile(r"```[ \t]*(?:json|JSON)?[ \t]*\n?(.*?)```", re.S)
+_JSON_START = re.compile(r"[\[{]")
+_decoder = json.JSONDecoder()
+
+def extract_json(text: str) -> Any:
+    """
+    从模型输出中提取 JSON：优先取 ``` 代码块中的内容，忽略前后的说明文字
+    """
+    candidates = [match.group(1) for match in _FENCE.finditer(text)]
+    candidates.append(text)
+    for candidate in candidates:
+        for match in _JSON_START.finditer(candidate):
+            try:
+                value, _ = _decoder.raw_decode(candidate, match.start())
+                return value
+            except json.JSONDecodeError:
+                continue
+    raise ValueError("未找到有效的 JSON")
+
+@lru_cache(maxsize=None)
+def case_list_adapter() -> TypeAdapter:
+    """List[CaseData] 的校验器只构建一次，整批数据一次调用完成校验"""
+    return TypeAdapter(List[CaseData])
+
+@dataclass
+class FieldError:
+    loc: str
+    msg: str
+    type: str
+    input: Any = None
+
+    def to_dict(self) -> Dict:
+        return {"loc": self.loc, "msg": self.msg, "type": self.type, "input": self.input}
+
+@dataclass
+class ValidationReport:
+    index: int
+    case: Optional[CaseData] = None
+    errors: List[FieldError] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.case is not None and not self.errors
+
+    def to_dict(self) -> Dict:
+        return {
+            "index": self.index,
+            "ok": self.ok,
+            "case": self.case.model_dump() if self.case is not None else None,
+            "errors": [error.to_dict() for error in self.errors],
+        }
+
+def _format_loc(loc) -> str:
+    # ('details', 'subject', 0, 'phone') -> details.subject[0].phone
+    path = ""
+    for part in loc:
+        if isinstance(part, int):
+            path += f"[{part}]"
+        else:
+            path += f".{part}" if path else str(part)
+    return path
+
+def _field_errors(error: ValidationError, strip_index: bool) -> Dict[int, List[FieldError]]:
+    grouped = {}
+    for item in error.errors(include_url=False):
+        loc = item["loc"]
+        index = loc[0] if strip_index else 0
+        grouped.setdefault(index, []).append(FieldError(
+            loc=_format_loc(loc[1:] if strip_index else loc),
+            msg=item["msg"],
+            type=item["type"],
+            input=item.get("input"),
+        ))
+    return grouped
+
+def _validate_chunk(items: List[Union[str, Dict]], offset: int = 0) -> List[ValidationReport]:
+    reports = [ValidationReport(index=offset + i) for i in range(len(items))]
+    parsed, positions = [], []
+    for i, item in enumerate(items):
+        if isinstance(item, str):
+            try:
+                item = extract_json(item)
+            except ValueError as e:
+                reports[i].errors.append(FieldError(loc="", msg=str(e), type="json_invalid"))
+                continue
+        parsed.append(item)
+        positions.append(i)
+
+    adapter = case_list_adapter()
+    try:
+        cases = adapter.validate_python(parsed)
+    except ValidationError as e:
+        # 整批失败时只对未报错的条目再校验一次，报错条目生成逐字段报告
+        grouped = _field_errors(e, strip_index=True)
+        for j, errors in grouped.items():
+            reports[positions[j]].errors.extend(errors)
+        valid = [j for j in range(len(parsed)) if j not in grouped]
+        cases = adapter.validate_python([parsed[j] for j in valid])
+        positions = [positions[j] for j in valid]
+    for position, case in zip(positions, cases):
+        reports[position].case = case
+    return reports
+
+def validate_cases(items: Iterable[Union[str, Dict]], processes: int = 0,
+                   chunk_size: int = 500) -> List[ValidationReport]:
+    """
+    批量解析并校验模型输出，按输入顺序返回每条的 ValidationReport
+
+    items 可以是模型原始输出文本或已解析的字典；processes > 0 且数据量超过
+    chunk_size 时按块分发到进程池
+    """
+    items = list(items)
+    if processes <= 0 or len(items) <= chunk_size:
+        return _validate_chunk(items)
+    offsets = range(0, len(items), chunk_size)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        chunks = executor.map(_validate_chunk, [items[i:i + chunk_size] for i in offsets], offsets)
+        return [report for chunk in chunks for report in chunk]
+
+def validate_case(item: Union[str, Dict]) -> ValidationReport:
+    """校验单条数据"""
+    return _validate_chunk([item])[0]
+
+def build_reask_prompt(report: ValidationReport, max_input_chars: int = 100) -> str:
+    """根据逐字段错误构建重新提问的消息，只要求模型修正出错的字段"""
+    lines = ["上一次输出的 JSON 未通过校验，请修正以下字段后重新输出完整的 JSON："]
+    for error in report.errors:
+        if error.type == "json_invalid":
+            lines.append(f"- 输出不是有效的 JSON：{error.msg}")
+            continue
+        value = json.dumps(error.input, ensure_ascii=False, default=str)
+        if len(value) > max_input_chars:
+            value = value[:max_input_chars] + "..."
+        lines.append(f"- {error.loc or '根对象'}: {error.msg}（当前值: {value}）")
+    return "\n".join(lines)
@@ -1,12 +1,25 @@
 import time
+import threading
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
 from typing import Optional
+from requests.adapters import HTTPAdapter
 from .adapters import get_adapter
+from .adapters.base import SSEParser, loads_bytes
+from .cache import SingleFlight
+from .canonical import MessageCanonicalizer, SimHashIndex, simhash
+from .concurrency import ConcurrencyController
+from .hedging import HedgePolicy
+from .ratelimit import RateLimiter, estimate_tokens
+from .result import RawRetention, RequestResult
+from .retry import RetryPolicy, error_status
 from .case.models import CaseData
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TIMEOUT = 10
+
 class APIClient:
     def __init__(self, cache, monitor, balancer, config):
         self.cache = cache
@@ -14,6 +27,56 @@ class APIClient:
         self.balancer = balancer
         self.config = config
         self.adapters = {}
+        self.sessions = {}
+        self._session_lock = threading.Lock()
+        self._inflight = SingleFlight()
+        self.rate_limiter = RateLimiter(balancer.providers)
+        self.retry_policy = RetryPolicy.from_config(config)
+        cache_config = config.api_config.get('cache', {})
+        self.canonicalizer = MessageCanonicalizer.from_config(cache_config.get('canonical'))
+        near_config = cache_config.get('near_duplicate') or {}
+        self.near_mode = near_config.get('mode', 'flag') if near_config.get('enabled') else None
+        self.near_index = SimHashIndex(near_config.get('max_distance', 3),
+                                       near_config.get('max_entries', 100000)) if self.near_mode else None
+        self.hedging = HedgePolicy.from_config(monitor, config)
+        self.concurrency = ConcurrencyController.from_config(monitor, config)
+        self.raw_retention = RawRetention.from_config(config)
+        self._hedge_executor = None
+        
+    def _get_session(self, provider: str) -> requests.Session:
+        """每个供应商共享一个带连接池的长连接会话"""
+        if provider not in self.sessions:
+            with self._session_lock:
+                if provider not in self.sessions:
+                    pool_size = self.balancer.providers[provider].get('pool_size', self._default_pool_size(provider))
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self.sessions[provider] = session
+        return self.sessions[provider]
+    
+    def _default_pool_size(self, provider: str) -> int:
+        """启用自适应并发时连接池按该供应商各 Key 的上限之和设置，否则取 max_workers"""
+        if self.concurrency is not None:
+            return self.concurrency.ceiling(self.balancer.providers, provider)
+        return self.config.api_config.get('max_workers', 5)
+    
+    def _get_timeout(self, provider: str):
+        """返回 (connect_timeout, read_timeout)"""
+        provider_config = self.balancer.providers[provider]
+        return (provider_config.get('connect_timeout', DEFAULT_TIMEOUT),
+                provider_config.get('read_timeout', DEFAULT_TIMEOUT))
+    
+    def close(self):
+        with self._session_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+            self.raw_retention.close()
+            if self._hedge_executor is not None:
+                self._hedge_executor.shutdown(wait=False)
+                self._hedge_executor = None
         
     def _get_adapter(self, provider: str):
         if provider not in self.adapters:
@@ -27,68 +90,366 @@ class APIClient:
                 return provider
         raise ValueError("Cannot determine provider from API key")
     
+    def _resolve_provider(self,
+                          provider: Optional[str] = None,
+                          api_key: Optional[str] = None) -> str:
+        if api_key:
+            return self._detect_provider(api_key)
+        provider = provider or self.config.api_config['default_provider']
+        if provider == 'auto':
+            return self.balancer.select_provider()
+        return provider
+    
+    def _select_key(self,
+                    provider: str,
+                    api_key: Optional[str] = None,
+                    key_index: Optional[int] = None,
+                    exclude: tuple = ()):
+        """返回 (provider_name, api_key)"""
+        if api_key:
+            self.balancer.acquire(provider, api_key)
+            return provider, api_key
+        if key_index is not None:
+            return self.balancer.get_specific_key(provider, key_index)
+        return self.balancer.get_next_key(provider, exclude)
+    
+    def _canonical(self, message: str, stage: Optional[str] = None) -> str:
+        """只有启用规范化的阶段（默认 description）按规范化后的消息计算缓存键"""
+        if self.canonicalizer is not None and self.canonicalizer.applies_to(stage):
+            return self.canonicalizer.canonicalize(message)
+        return message
+    
+    def _pinned_key(self, provider: str, api_key: Optional[str] = None, key_index: Optional[int] = None):
+        """调用方指定的 Key，未指定时返回 None"""
+        if api_key:
+            return api_key
+        if key_index is not None:
+            keys = self.balancer.providers[provider]['keys']
+            return keys[key_index] if key_index < len(keys) else None
+        return None
+    
+    def _cache_key(self, provider: str, message: str, kwargs: dict, canonical: Optional[str] = None,
+                   stage: Optional[str] = None, api_key: Optional[str] = None,
+                   key_index: Optional[int] = None) -> str:
+        """
+        缓存键按（规范化后的）消息计算，description 阶段的格式差异不影响命中；
+        指定了 Key 的请求按 Key 区分，使用不同 Dify 应用的阶段不会共享结果
+        """
+        spec = self.config.api_specs.get(provider, {})
+        if canonical is None:
+            canonical = self._canonical(message, stage)
+        return self.cache.make_key(provider, spec.get('required_params', {}), kwargs, canonical,
+                                   self._pinned_key(provider, api_key, key_index))
+    
+    def _lookup(self, provider: str, message: str, kwargs: dict, stage: Optional[str] = None,
+                api_key: Optional[str] = None, key_index: Optional[int] = None):
+        """
+        查询缓存与近似重复索引，返回 (cache_key, SimHash 指纹, 缓存结果, 近似匹配)；
+        指纹只在缓存未命中且启用近似索引时计算，之后交给 _remember 复用
+        """
+        canonical = self._canonical(message, stage)
+        cache_key = self._cache_key(provider, message, kwargs, canonical, api_key=api_key, key_index=key_index)
+        if cached := self.cache.get(cache_key):
+            self.monitor.record_cache(provider, True, stage)
+            return cache_key, None, cached, None
+        fingerprint, similar = None, None
+        if self.near_index is not None:
+            fingerprint = simhash(canonical)
+            scope = self._cache_key(provider, "", kwargs, "", api_key=api_key, key_index=key_index)
+            match = self.near_index.query(fingerprint, scope, cache_key)
+            if match is not None:
+                similar = {"key": match[0], "distance": match[1]}
+                cached = self.cache.get(match[0]) if self.near_mode == 'serve' else None
+                if cached:
+                    # serve 模式直接复用相似描述的结果，并标明来源
+                    self.monitor.record_cache(provider, True, stage, near=True)
+                    return cache_key, fingerprint, cached.with_fields(near_duplicate=similar), similar
+        self.monitor.record_cache(provider, False, stage)
+        return cache_key, fingerprint, None, similar
+    
+    def _remember(self, provider: str, kwargs: dict, cache_key: str, fingerprint: Optional[int], result: dict,
+                  similar=None, api_key: Optional[str] = None, key_index: Optional[int] = None):
+        """成功结果加入近似重复索引；flag 模式下在结果中标出相似的已有结果"""
+        if self.near_index is None or fingerprint is None or not result.get("success"):
+            return result
+        scope = self._cache_key(provider, "", kwargs, "", api_key=api_key, key_index=key_index)
+        self.near_index.add(cache_key, fingerprint, scope)
+        if similar is not None:
+            return result.with_fields(similar_to=similar)
+        return result
+    
+    def _build_request(self, provider: str, selected_key: str):
+        """返回 (url, headers)"""
+        endpoint = self.config.api_specs[provider].get('endpoint', '')
+        url = f"{self.balancer.providers[provider]['base_url']}{endpoint}"
+        headers = {
+            "Authorization": f"Bearer {selected_key}",
+            "Content-Type": "application/json"
+        }
+        return url, headers
+    
+    def _success_result(self, provider: str, content, raw) -> RequestResult:
+        """raw 为响应体字节或已解析的响应，按 api_config.results 的保留方式保存"""
+        return RequestResult(provider, content, raw=self.raw_retention.keep(raw))
+    
+    def _error_result(self, provider: str, error: Exception) -> RequestResult:
+        return RequestResult(provider, success=False, error=str(error))
+    
+    def _record(self, provider: str, selected_key: str, success: bool,
+                elapsed: float, error: Optional[Exception] = None):
+        """将请求结果同时回报给监控与负载均衡器"""
+        status = error_status(error) if error is not None else None
+        self.balancer.release(provider, selected_key, success, elapsed, status)
+        if self.concurrency is not None:
+            self.concurrency.release(provider, selected_key, elapsed, error)
+        self.monitor.record_request(provider, success, elapsed, selected_key, status)
+    
+    def _record_cancelled(self, provider: str, selected_key: str):
+        """请求被取消或流被提前关闭，只释放 Key 与在途计数"""
+        self.balancer.release(provider, selected_key, None)
+        if self.concurrency is not None:
+            self.concurrency.release(provider, selected_key)
+        self.monitor.record_cancelled(provider, selected_key)
+    
+    def _next_retry(self, provider, attempt, backoff_time, error, api_key, key_index, tried_keys):
+        """判断是否重试：返回 (delay, exclude_keys)，不再重试时返回 None"""
+        category = self.retry_policy.classify(error)
+        if not self.retry_policy.should_retry(attempt, category):
+            if attempt:
+                self.monitor.record_retry(provider, attempt, backoff_time)
+            return None
+        delay = self.retry_policy.delay(attempt, error)
+        logger.warning(f"Retrying {provider} request ({category}, attempt {attempt + 1}) in {delay:.2f}s")
+        # 未指定 Key 时换下一个 Key 重试
+        exclude = tried_keys if self.retry_policy.failover and not (api_key or key_index is not None) else ()
+        return delay, exclude
+    
     def send_request(self,
                      message: str,
                      provider: Optional[str] = None,
                      api_key: Optional[str] = None,
                      key_index: Optional[int] = None,
+                     stage: Optional[str] = None,
                      **kwargs):
-        if cached := self.cache.get(message):
+        """发送单个请求；stage 只用于按阶段统计缓存命中率，不进入请求参数"""
+        provider = self._resolve_provider(provider, api_key)
+        cache_key, fingerprint, cached, similar = self._lookup(provider, message, kwargs, stage, api_key, key_index)
+        if cached:
             return cached
         
-        if api_key:
-            provider = self._detect_provider(api_key)
-            selected_key = api_key
-        elif provider:
-            if key_index is not None:
-                provider, selected_key = self.balancer.get_specific_key(provider, key_index)
-            else:
-                provider, selected_key = self.balancer.get_next_key(provider)
-        else:
-            provider = self.config.api_config['default_provider']
-            provider, selected_key = self.balancer.get_next_key(provider)
+        # 相同键的并发请求只发送一次，其余调用方共享结果
+        result, shared = self._inflight.do(
+            cache_key,
+            lambda: self._send(message, provider, api_key, key_index, cache_key, **kwargs)
+        )
+        if shared:
+            self.monitor.record_coalesced(provider)
+        return self._remember(provider, kwargs, cache_key, fingerprint, result, similar, api_key, key_index)
+    
+    def _send(self, message, provider, api_key, key_index, cache_key, **kwargs):
+        attempt, backoff_time, exclude = 0, 0.0, ()
+        tried_keys = []
+        while True:
+            selected_provider, selected_key = self._select_key(provider, api_key, key_index, exclude)
+            tried_keys.append(selected_key)
+            result, error = self._hedged_attempt(message, selected_provider, selected_key, cache_key,
+                                                 bool(api_key) or key_index is not None, **kwargs)
+            if error is None:
+                if attempt:
+                    self.monitor.record_retry(selected_provider, attempt, backoff_time)
+                return result
+            
+            retry = self._next_retry(selected_provider, attempt, backoff_time, error,
+                                     api_key, key_index, tuple(tried_keys))
+            if retry is None:
+                return result
+            delay, exclude = retry
+            time.sleep(delay)
+            attempt += 1
+            backoff_time += delay
+    
+    def _select_hedge(self, provider: str, selected_key: str):
+        """为对冲请求选择另一个 Key，同一供应商没有其他可用 Key 时按配置换用其他供应商，无法对冲时返回 None"""
+        hedge_provider, hedge_key = self.balancer.get_next_key(provider, (selected_key,))
+        if hedge_key != selected_key:
+            return hedge_provider, hedge_key
+        self.balancer.release(hedge_provider, hedge_key, None)
+        if self.hedging.cross_provider:
+            for other in self.balancer.healthy_providers():
+                if other != provider:
+                    return self.balancer.get_next_key(other)
+        return None
+    
+    def _get_hedge_executor(self) -> ThreadPoolExecutor:
+        if self._hedge_executor is None:
+            with self._session_lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(
+                        max_workers=self.config.api_config.get('max_concurrency', 100),
+                        thread_name_prefix="hedge")
+        return self._hedge_executor
+    
+    def _hedged_attempt(self, message, provider, selected_key, cache_key, pinned, **kwargs):
+        """执行一次调用，超过对冲延迟仍未返回时向另一个 Key 发送副本，返回先成功的 (result, error)
         
-        adapter = self._get_adapter(provider)
-        endpoint = self.config.api_specs[provider].get('endpoint', '')
+        线程中的请求无法中断，落后的一方完成后照常计入监控与负载均衡，其结果被丢弃
+        """
+        delay = self.hedging.delay(provider) if self.hedging is not None and not pinned else None
+        if delay is None:
+            return self._attempt(message, provider, selected_key, cache_key, **kwargs)
         
-        url = f"{self.balancer.providers[provider]['base_url']}{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {selected_key}",
-            "Content-Type": "application/json"
-        }
+        executor = self._get_hedge_executor()
+        primary = executor.submit(self._attempt, message, provider, selected_key, cache_key, **kwargs)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        hedge = self._select_hedge(provider, selected_key) if self.hedging.try_acquire() else None
+        if hedge is None:
+            return primary.result()
         
+        self.monitor.record_hedge(provider)
+        hedge_future = executor.submit(self._attempt, message, *hedge, cache_key, **kwargs)
+        for future in as_completed((primary, hedge_future)):
+            result, error = future.result()
+            if error is None:
+                if future is hedge_future:
+                    self.monitor.record_hedge_win(provider)
+                return result, error
+        return primary.result()
+    
+    def _attempt(self, message, provider, selected_key, cache_key, **kwargs):
+        """执行一次 HTTP 调用，返回 (result, error)；cache_key 为 None 时不写缓存"""
+        adapter = self._get_adapter(provider)
+        url, headers = self._build_request(provider, selected_key)
+        
+        # 自适应并发名额在进入 try 之前占用，之后的每条路径都经 _record/_record_cancelled 归还
+        if self.concurrency is not None:
+            self.concurrency.acquire(provider, selected_key)
+        self.monitor.record_start(provider, selected_key)
+        start_time = time.time()
         try:
             # 构建供应商特定的请求
-            payload = adapter.format_request(message, **kwargs)
+            body = adapter.build_body(message, **kwargs)
+            # 按 RPM/TPM 限额排队，排队时间不计入请求延迟
+            tokens = estimate_tokens(body, adapter.max_tokens(kwargs))
+            self.rate_limiter.acquire(provider, selected_key, tokens)
             start_time = time.time()
             
-            response = requests.post(
+            response = self._get_session(provider).post(
                 url,
                 headers=headers,
-                json=payload,
-                timeout=10
+                data=body,
+                timeout=self._get_timeout(provider)
             )
             response.raise_for_status()
-            response_data = response.json()
+            response_data = loads_bytes(response.content)
             
-            # 标准化响应
+            # 标准化响应，raw 保留原始字节，访问时才解析
             content = adapter.parse_response(response_data)
-            result = {
-                "provider": provider,
-                "content": content,
-                "raw": response_data,
-                "success": True,
-            }
+            result = self._success_result(provider, content, response.content)
             
-            self.monitor.record_request(provider, True, time.time()-start_time)
-            self.cache.set(message, result)
-            return result
+            self._record(provider, selected_key, True, time.time()-start_time)
+            if cache_key is not None:
+                self.cache.set(cache_key, result)
+            return result, None
             
         except Exception as e:
             logger.error(f"API request failed: {str(e)}")
-            self.monitor.record_request(provider, False, time.time()-start_time)
-            return {
-                "provider": provider,
-                "error": str(e),
-                "success": False,
-            }
\ No newline at end of file
+            self._record(provider, selected_key, False, time.time()-start_time, e)
+            return self._error_result(provider, e), e
+    
+    def stream_request(self,
+                       message: str,
+                       provider: Optional[str] = None,
+                       api_key: Optional[str] = None,
+                       key_index: Optional[int] = None,
+                       **kwargs):
+        """流式请求，逐个产出内容增量；读超时作用于相邻数据块之间而非整个响应
+        
+        首个增量产出前的失败按重试策略重试，之后的失败直接抛出
+        """
+        provider = self._resolve_provider(provider, api_key)
+        cache_key = self._cache_key(provider, message, kwargs, api_key=api_key, key_index=key_index)
+        if cached := self.cache.get(cache_key):
+            self.monitor.record_cache(provider, True)
+            yield cached['content']
+            return
+        self.monitor.record_cache(provider, False)
+        
+        attempt, backoff_time, exclude = 0, 0.0, ()
+        tried_keys = []
+        while True:
+            selected_provider, selected_key = self._select_key(provider, api_key, key_index, exclude)
+            tried_keys.append(selected_key)
+            chunks = []
+            try:
+                for delta in self._stream_attempt(message, selected_provider, selected_key, **kwargs):
+                    chunks.append(delta)
+                    yield delta
+            except Exception as e:
+                retry = None if chunks else self._next_retry(
+                    selected_provider, attempt, backoff_time, e, api_key, key_index, tuple(tried_keys))
+                if retry is None:
+                    raise
+                delay, exclude = retry
+                time.sleep(delay)
+                attempt += 1
+                backoff_time += delay
+                continue
+            
+            if attempt:
+                self.monitor.record_retry(selected_provider, attempt, backoff_time)
+            self.cache.set(cache_key, self._success_result(selected_provider, "".join(chunks), None))
+            return
+    
+    def _stream_attempt(self, message, provider, selected_key, **kwargs):
+        adapter = self._get_adapter(provider)
+        url, headers = self._build_request(provider, selected_key)
+        headers["Accept"] = "text/event-stream"
+        
+        if self.concurrency is not None:
+            self.concurrency.acquire(provider, selected_key)
+        self.monitor.record_start(provider, selected_key)
+        start_time = time.time()
+        first_token_time = None
+        try:
+            body = adapter.build_stream_body(message, **kwargs)
+            # 按 RPM/TPM 限额排队，排队时间不计入请求延迟
+            tokens = estimate_tokens(body, adapter.max_tokens(kwargs))
+            self.rate_limiter.acquire(provider, selected_key, tokens)
+            start_time = time.time()
+            
+            with self._get_session(provider).post(
+                url,
+                headers=headers,
+                data=body,
+                timeout=self._get_timeout(provider),
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                parser = SSEParser()
+                for line in response.iter_lines(chunk_size=None):
+                    event = parser.feed(line)
+                    if event is SSEParser.DONE:
+                        break
+                    if event is None:
+                        continue
+                    delta = adapter.parse_stream_event(event)
+                    if not delta:
+                        continue
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        self.monitor.record_first_token(provider, first_token_time)
+                    yield delta
+            
+        except Exception as e:
+            logger.error(f"API stream request failed: {str(e)}")
+            self._record(provider, selected_key, False, time.time()-start_time, e)
+            raise
+        except GeneratorExit:
+            # 调用方提前结束迭代，只释放 Key 不记录结果
+            self._record_cancelled(provider, selected_key)
+            raise
+        
+        self._record(provider, selected_key, True, time.time()-start_time)
@@ -0,0 +1,173 @@
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+import requests
+from .monitor import mask_key
+from .retry import error_status
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_STATUS = {429, 503}
+
+def is_overload(error: Optional[Exception]) -> bool:
+    """429/503 与超时视为供应商过载"""
+    if error is None:
+        return False
+    if error_status(error) in OVERLOAD_STATUS:
+        return True
+    return isinstance(error, (requests.Timeout, TimeoutError, asyncio.TimeoutError))
+
+class AIMDLimiter:
+    """
+    单个 Key 的自适应在途上限（加性增、乘性减，类似 TCP 拥塞控制）
+
+    上限被占满时每完成一个成功请求增加 increase / limit，即每轮约加 increase；
+    过载或短期延迟超过基线的 tolerance 倍时乘以 decrease，一个延迟周期内最多下调一次。
+    基线延迟只缓慢上升、立即下降，用于区分排队造成的延迟上升与回答变长
+    """
+
+    def __init__(self, initial: float = 5, min_limit: float = 1, max_limit: float = 50,
+                 increase: float = 1.0, decrease: float = 0.5, tolerance: float = 2.0,
+                 alpha: float = 0.3, baseline_alpha: float = 0.02, min_samples: int = 10):
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.alpha = alpha
+        self.baseline_alpha = baseline_alpha
+        self.min_samples = min_samples
+        self.in_flight = 0
+        self.samples = 0
+        self.latency = 0.0
+        self.baseline = 0.0
+        self.last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters = []
+
+    def _available(self) -> bool:
+        return self.in_flight < max(int(self.limit), 1)
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if not self._available():
+                return False
+            self.in_flight += 1
+            return True
+
+    def acquire(self):
+        with self._cond:
+            while not self._available():
+                self._cond.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self._available():
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def _wake(self):
+        # 持锁调用；被取消的异步等待者不会消费通知，因此唤醒全部等待者重新竞争
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_set_done, waiter)
+
+    def _decrease(self, now: float) -> bool:
+        if now - self.last_decrease < self.latency:
+            return False
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        return True
+
+    def release(self, latency: Optional[float] = None, overload: bool = False) -> bool:
+        """
+        归还在途名额并按结果调整上限；latency 为 None 表示请求被取消或失败但不说明负载，上限不变。
+        返回上限是否被下调
+        """
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight = max(self.in_flight - 1, 0)
+            decreased = False
+            if overload:
+                decreased = self._decrease(time.monotonic())
+            elif latency is not None:
+                self.samples += 1
+                self.latency = latency if self.samples == 1 else (
+                    self.alpha * latency + (1 - self.alpha) * self.latency)
+                if self.samples == 1 or self.latency < self.baseline:
+                    self.baseline = self.latency
+                else:
+                    self.baseline += self.baseline_alpha * (self.latency - self.baseline)
+                if self.samples >= self.min_samples and self.latency > self.tolerance * self.baseline:
+                    decreased = self._decrease(time.monotonic())
+                elif saturated:
+                    self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            self._wake()
+            return decreased
+
+def _set_done(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+class ConcurrencyController:
+    """
+    按供应商与 Key 维护 AIMDLimiter，HTTP 调用前占用名额、完成后回报结果；
+    当前上限通过 PerformanceMonitor.record_concurrency 暴露，协调器的 max_workers 只作为总并发的上限
+    """
+
+    def __init__(self, monitor, **options):
+        self.monitor = monitor
+        self.options = options
+        self.limiters: Dict[Tuple[str, str], AIMDLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, monitor, config):
+        options = dict(config.api_config.get('concurrency') or {})
+        if not options.pop('enabled', False):
+            return None
+        return cls(monitor, **options)
+
+    def ceiling(self, providers: Dict, provider: Optional[str] = None) -> int:
+        """各 Key 上限之和，作为线程池与连接池的大小；给出 provider 时只计该供应商"""
+        names = [provider] if provider else list(providers)
+        max_limit = self.options.get('max_limit', 50)
+        return int(sum(max_limit * len(providers[name]['keys']) for name in names))
+
+    def limiter(self, provider: str, api_key: str) -> AIMDLimiter:
+        limiter = self.limiters.get((provider, api_key))
+        if limiter is None:
+            with self._lock:
+                limiter = self.limiters.get((provider, api_key))
+                if limiter is None:
+                    limiter = self.limiters[(provider, api_key)] = AIMDLimiter(**self.options)
+                    self.monitor.record_concurrency(provider, api_key, int(limiter.limit))
+        return limiter
+
+    def acquire(self, provider: str, api_key: str):
+        self.limiter(provider, api_key).acquire()
+
+    async def acquire_async(self, provider: str, api_key: str):
+        await self.limiter(provider, api_key).acquire_async()
+
+    def release(self, provider: str, api_key: str, latency: Optional[float] = None,
+                error: Optional[Exception] = None):
+        """请求完成后回报；成功时传入延迟，失败时传入异常"""
+        limiter = self.limiter(provider, api_key)
+        before = int(limiter.limit)
+        overload = is_overload(error)
+        if limiter.release(latency if error is None else None, overload):
+            logger.info(f"Concurrency limit of {provider} key {mask_key(api_key)} lowered to {int(limiter.limit)}"
+                        f" ({'overload' if overload else 'latency increase'})")
+        if int(limiter.limit) != before:
+            self.monitor.record_concurrency(provider, api_key, int(limiter.limit))
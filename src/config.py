@@ -9,6 +9,13 @@ class Config:
         with open(config_path, 'r') as file:
             self.config = yaml.safe_load(file)
     
+    @classmethod
+    def from_dict(cls, config: dict):
+        """由字典构建配置而不读取 config.yaml，用于基准与本地调试"""
+        instance = cls.__new__(cls)
+        instance.config = config
+        return instance
+
     @classmethod
     def get_instance(cls):
         if not cls._instance:
@@ -25,4 +32,8 @@ class Config:
     
     @property
     def api_specs(self):
-        return self.config.get('api_specs', {})
\ No newline at end of file
+        return self.config.get('api_specs', {})
+    
+    @property
+    def case_config(self):
+        return self.config.get('case', {})
\ No newline at end of file
@@ -0,0 +1,50 @@
+import threading
+from typing import Optional
+
+class HedgePolicy:
+    """
+    对冲请求策略：一次调用超过自适应延迟仍未返回时，向另一个 Key 或供应商发送副本，先成功者生效
+
+    延迟取该供应商观测延迟的分位数并限制在 [min_delay, max_delay] 内；
+    对冲请求总数不超过 budget × 主请求数，观测样本不足 min_samples 时不对冲
+    """
+
+    def __init__(self, monitor, budget: float = 0.05, percentile: float = 0.95,
+                 min_delay: float = 0.5, max_delay: float = 10.0, min_samples: int = 20,
+                 cross_provider: bool = False):
+        self.monitor = monitor
+        self.budget = budget
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.cross_provider = cross_provider
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, monitor, config):
+        options = dict(config.api_config.get('hedging') or {})
+        if not options.pop('enabled', False):
+            return None
+        return cls(monitor, **options)
+
+    def delay(self, provider: str) -> Optional[float]:
+        """登记一次主请求并返回对冲前的等待时间，不对冲时返回 None"""
+        with self._lock:
+            self.requests += 1
+            if self.requests < self.min_samples:
+                return None
+        observed = self.monitor.percentile(self.percentile, provider)
+        if observed <= 0:
+            return None
+        return min(max(observed, self.min_delay), self.max_delay)
+
+    def try_acquire(self) -> bool:
+        """占用一次对冲预算，超出预算时返回 False"""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
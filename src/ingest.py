@@ -0,0 +1,115 @@
+import csv
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+import openpyxl
+import pandas as pd
+
+NULL_PLACEHOLDER = "None"
+
+def format_value(value) -> str:
+    """空值以 None 表示；整数值的浮点数去掉小数部分，含空值的 Parquet 整数列读取后与 openpyxl 的格式一致"""
+    if value is None:
+        return NULL_PLACEHOLDER
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def format_row(columns: Sequence, values: Sequence) -> str:
+    """将一行数据格式化为 `列名: 值` 的多行文本"""
+    return "\n".join(f"{col}: {format_value(value)}" for col, value in zip(columns, values))
+
+def format_frame(df: pd.DataFrame) -> List[str]:
+    """format_row 的向量化版本，按列拼接字符串而不是逐行 iterrows"""
+    if df.empty:
+        return []
+    filled = df.astype(object).where(df.notna(), None)
+    messages = None
+    for col in df.columns:
+        part = f"{col}: " + filled[col].map(format_value)
+        messages = part if messages is None else messages + "\n" + part
+    return messages.tolist()
+
+def _keep_row_numbers(rows: Iterator[Tuple[bool, str]]) -> Iterator[str]:
+    """
+    rows 为 (是否空行, 消息)。中间的空行照常产出，保证第 i 条消息对应表格的第 start_row + i 行；
+    只丢弃末尾连续的空行（Excel 的格式化空行、CSV 末尾的空行）
+    """
+    held = []
+    for empty, message in rows:
+        if empty:
+            held.append(message)
+            continue
+        yield from held
+        held.clear()
+        yield message
+
+def _frame_rows(df: pd.DataFrame) -> Iterator[Tuple[bool, str]]:
+    return zip(df.isna().all(axis=1).tolist(), format_frame(df))
+
+def _normalize_header(header: Sequence) -> List[str]:
+    # 与 pandas 的空表头命名保持一致
+    return [f"Unnamed: {i}" if col is None else str(col) for i, col in enumerate(header)]
+
+def iter_excel(file_path, start_row: int = 2, end_row: Optional[int] = None) -> Iterator[str]:
+    """以 openpyxl 只读模式逐行读取，不把整个工作簿载入内存"""
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        header = _normalize_header(next(sheet.iter_rows(min_row=1, max_row=1, values_only=True)))
+        rows = sheet.iter_rows(min_row=start_row, max_row=end_row, values_only=True)
+        yield from _keep_row_numbers((all(value is None for value in values), format_row(header, values))
+                                     for values in rows)
+    finally:
+        workbook.close()
+
+def iter_csv(file_path, start_row: int = 2, end_row: Optional[int] = None,
+             chunk_size: int = 10000) -> Iterator[str]:
+    """按块读取 CSV，每块向量化格式化；单元格按文本读取，身份证号、前导零等与 Excel 文本单元格一致"""
+    with open(file_path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f))
+    nrows = end_row - start_row + 1 if end_row else None
+    # 空行同样占一个行号，不能被跳过
+    reader = pd.read_csv(file_path, header=0, names=header, skiprows=range(1, start_row - 1),
+                         nrows=nrows, chunksize=chunk_size, encoding='utf-8-sig', skip_blank_lines=False,
+                         dtype=str, keep_default_na=False, na_values=[""])
+    yield from _keep_row_numbers(row for chunk in reader for row in _frame_rows(chunk))
+
+def iter_parquet(file_path, start_row: int = 2, end_row: Optional[int] = None,
+                 chunk_size: int = 10000) -> Iterator[str]:
+    """按 record batch 读取 Parquet，行号沿用 Excel 约定（第 1 行为表头）"""
+    import pyarrow.parquet as pq  # Parquet 支持为可选依赖
+
+    yield from _keep_row_numbers(_parquet_rows(pq.ParquetFile(file_path), start_row, end_row, chunk_size))
+
+def _parquet_rows(parquet_file, start_row: int, end_row: Optional[int], chunk_size: int):
+    skip = start_row - 2
+    remaining = end_row - start_row + 1 if end_row else None
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        if skip >= batch.num_rows:
+            skip -= batch.num_rows
+            continue
+        batch = batch.slice(skip)
+        skip = 0
+        if remaining is not None:
+            batch = batch.slice(0, remaining)
+            remaining -= batch.num_rows
+        yield from _frame_rows(batch.to_pandas())
+        if remaining == 0:
+            break
+
+READERS = {
+    ".xlsx": iter_excel,
+    ".xlsm": iter_excel,
+    ".csv": iter_csv,
+    ".parquet": iter_parquet,
+}
+
+def iter_messages(file_path, start_row: int = 2, end_row: Optional[int] = None) -> Iterator[str]:
+    """按文件类型流式读取 [start_row, end_row] 范围内的行并格式化为消息"""
+    suffix = Path(file_path).suffix.lower()
+    reader = READERS.get(suffix)
+    if reader is None:
+        raise ValueError(f"Unsupported file type {suffix}")
+    if start_row < 2 or (end_row is not None and end_row < start_row):
+        raise ValueError("无效的行号范围")
+    return reader(file_path, start_row, end_row)
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict
+from .result import RequestResult
+
+class CheckpointJournal:
+    """
+    追加写入的 JSONL 检查点日志，每完成一个请求写入一行
+
+    flush + fsync 按条数或时间间隔批量进行，崩溃时最多丢失最后一批；
+    加载时忽略写了一半的末行
+    """
+
+    def __init__(self, path, fsync_every: int = 50, fsync_interval: float = 1.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def message_hash(message: str) -> str:
+        return hashlib.sha256(message.encode('utf-8')).hexdigest()
+
+    def load(self) -> Dict[int, dict]:
+        """返回 {输入序号: 最新记录}"""
+        entries = {}
+        if not self.path.exists():
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                entry['result'] = RequestResult.from_dict(entry['result'])
+                entries[entry['index']] = entry
+        return entries
+
+    def is_done(self, entry, digest: str, retry_failed: bool = True) -> bool:
+        """记录与当前消息一致且无需重跑时返回 True"""
+        return (entry is not None and entry['hash'] == digest
+                and (entry['success'] or not retry_failed))
+
+    def record(self, index: int, digest: str, result: dict):
+        line = json.dumps({
+            "index": index,
+            "hash": digest,
+            "success": bool(result.get("success")),
+            "ts": time.time(),
+            "result": result.to_dict() if isinstance(result, RequestResult) else result,
+        }, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = self._open()
+            self._file.write(line + "\n")
+            self._pending += 1
+            if (self._pending >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+
+    def _open(self):
+        # 上次崩溃留下的半行需要先换行，避免与新记录粘连
+        torn = False
+        if self.path.exists() and self.path.stat().st_size:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+        file = open(self.path, 'a', encoding='utf-8')
+        if torn:
+            file.write("\n")
+        return file
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None and self._pending:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                if self._pending:
+                    self._sync()
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
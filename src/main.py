@@ -1,11 +1,20 @@
+import json
 import logging
-import pandas as pd
+from functools import partial
+from pathlib import Path
 from .config import Config
-from .cache import MessageCache
+from .cache import MessageCache, DiskCache
 from .monitor import PerformanceMonitor
 from .balancer import LoadBalancer
 from .client import APIClient
 from .requestor import RequestCoordinator
+from .ingest import iter_messages
+from .journal import CheckpointJournal
+from .pipeline import Pipeline, Stage
+from .packing import MessagePacker
+from .case.storage import CaseStorage
+from .case.graph import EntityIndex
+from .case.validation import validate_case
 
 def setup_logging():
     config = Config.get_instance()
@@ -14,63 +23,101 @@ def setup_logging():
 def construct_msg_description(file_path, start_row=2, end_row=None):
     """
     基于`Excel表格`构建`获取案件描述`的请求消息
+
+    以生成器方式逐行产出，支持 xlsx/csv/parquet，不会将整个文件载入内存
     """
     try:
-        # 读取整个表格
-        df = pd.read_excel(file_path, header=0, engine='openpyxl')
-
-        # 将空值替换为 None
-        df = df.fillna(value="None")
-        
-        # 处理行号范围
-        start_idx = max(start_row - 2, 0)  # 数据行索引从0开始
-        end_idx = end_row - 2 if end_row else len(df)-1
-        
-        # 有效性检查
-        if start_idx > end_idx or end_idx >= len(df):
-            raise ValueError("无效的行号范围")
-            
-        # 切片获取数据
-        selected = df.iloc[start_idx:end_idx+1]
-        
-        # 转换为消息格式
-        messages = []
-        for _, row in selected.iterrows():
-            # 生成结构化内容
-            content = "\n".join([f"{col}: {row[col]}" for col in df.columns])
-            messages.append(content)
-            
-        return messages
-
+        yield from iter_messages(file_path, max(start_row, 2), end_row)
     except Exception as e:
         print(f"读取失败: {str(e)}")
-        return []
+
+def build_case_info(result):
+    """
+    基于单条`案件描述`结果构建`获取案件基础信息`的请求消息
+    """
+    return result["content"]
+
+def summarize_case(case, shared=()):
+    """相关案件只保留关联所需的字段，控制关系提示词的长度"""
+    details = case.get("details") or {}
+    return {
+        "id": case.get("id"),
+        "title": case.get("title"),
+        "occur_time": (case.get("time") or {}).get("occur_time"),
+        "location": case.get("location"),
+        "persons": [
+            {key: person.get(key) for key in ("name", "phone", "id_card")}
+            for person in (details.get("subject") or []) + (details.get("object") or [])
+        ],
+        "shared": [f"{kind}:{value}" for kind, value in shared],
+    }
+
+def build_relationship(result, storage=None, index=None, max_neighbors=20):
+    """
+    基于单条`案件基础信息`结果构建`获取案件关系`的请求消息
+
+    给出 storage 与 index 时，校验通过的案件先查出共享人员或地点的已有案件附在消息后，
+    再写入存储与实体索引，提示词长度只与关联案件数有关，不随案件总量增长
+    """
+    content = result["content"]
+    if storage is None or index is None:
+        return content
+    report = validate_case(content)
+    if not report.ok:
+        return content
+    case = report.case.model_dump()
+    neighbors = []
+    for case_id, _, shared in index.related_cases(case, limit=max_neighbors):
+        related = storage.get_case(case_id, raw=True)
+        if related is not None:
+            neighbors.append(summarize_case(related, shared))
+    storage.save_case(report.case)
+    index.add_case(case)
+    if not neighbors:
+        return content
+    return f"{content}\n\n相关已有案件:\n{json.dumps(neighbors, ensure_ascii=False)}"
+
+def build_law(result):
+    """
+    基于单条`案件描述`结果构建`获取案件法律层要素`的请求消息，暂未实现时返回 None
+    """
+    return None
 
 def construct_msg_case_info(results):
     """
     基于`案件描述`构建`获取案件基础信息`的请求消息
     """
-    msg = []
-    for res in results:
-        msg.append(res["content"])
-    return msg
+    return [build_case_info(res) for res in results]
 
-def construct_msg_relationship(results):
+def construct_msg_relationship(results, storage=None, index=None):
     """
     基于`现有案件`和`新增案件描述`构建`获取案件关系`的请求消息
     """
-    msg = []
-    for res in results:
-        # TODO: 引入图数据库
-        msg.append(res["content"])
-    return msg
+    return [build_relationship(res, storage, index) for res in results]
 
 def construct_msg_law(results):
     """
     基于`案件描述`构建`获取案件法律层要素`的请求消息
     """
-    msg = []
-    return msg
+    return [msg for msg in map(build_law, results) if msg is not None]
+
+STAGE_BUILDERS = {
+    "description": None,
+    "case_info": build_case_info,
+    "relationship": build_relationship,
+    "law": build_law,
+}
+
+def run_pipeline(client, messages, stage_config, window=None, builders=None):
+    """
+    按 `case.pipeline` 中的阶段顺序流水线执行，单条数据完成一个阶段后立即进入下一阶段
+    """
+    builders = {**STAGE_BUILDERS, **(builders or {})}
+    stages = [Stage.from_config(name, builders[name], options or {})
+              for name, options in stage_config.items()]
+    pipeline = Pipeline(client, stages, window)
+    results = dict(pipeline.run(messages))
+    return [results[index] for index in sorted(results)], pipeline.stats()
 
 def main():
     # 初始化配置
@@ -78,23 +125,76 @@ def main():
     config = Config.get_instance()
     
     # 初始化组件
-    cache = MessageCache(ttl=config.api_config['ttl'])
-    monitor = PerformanceMonitor()
-    balancer = LoadBalancer(config.api_config['providers'])
+    cache_config = config.api_config.get('cache', {})
+    disk_cache = None
+    if cache_config.get('disk_path'):
+        disk_cache = DiskCache(cache_config['disk_path'],
+                               ttl=cache_config.get('disk_ttl', 7 * 24 * 3600),
+                               max_bytes=cache_config.get('disk_max_bytes', 512 * 1024 * 1024))
+    cache = MessageCache(ttl=config.api_config['ttl'],
+                         max_size=cache_config.get('max_size', 1000),
+                         disk=disk_cache,
+                         max_bytes=cache_config.get('max_bytes'),
+                         max_entry_bytes=cache_config.get('max_entry_bytes'))
+    monitor_config = config.api_config.get('monitor', {})
+    monitor = PerformanceMonitor(monitor_config.get('throughput_window', 60))
+    if monitor_config.get('snapshot_path'):
+        monitor.start_snapshots(monitor_config['snapshot_path'], monitor_config.get('snapshot_interval', 60))
+    balancer = LoadBalancer(config.api_config['providers'], config.api_config.get('balancer'))
     client = APIClient(cache, monitor, balancer, config)
-    requestor = RequestCoordinator(client, config.api_config['max_workers'])
+    max_workers = config.api_config['max_workers']
+    if client.concurrency is not None:
+        # 在途数由各 Key 的自适应上限决定，线程池按上限之和设置，否则上限只会下降
+        max_workers = client.concurrency.ceiling(balancer.providers, "dify")
+    requestor = RequestCoordinator(client, max_workers)
 
     excel_path = "C:\\Users\\mdaqua\\Desktop\\Workbench\\Dazhou\\LLM-General-Caller\\test\\base.xlsx"
     start_row = 801  # 开始读取行号
     end_row = 801  # 结束读取行号，None表示读取到文件末尾
 
+    # 同一文件与行号范围共用一个检查点，中断后重跑只补齐未完成和失败的请求
+    journal = None
+    if config.case_config.get('checkpoint_dir'):
+        journal = CheckpointJournal(Path(config.case_config['checkpoint_dir'])
+                                    / f"{Path(excel_path).stem}_{start_row}_{end_row}_description.jsonl")
+
     messages_description = construct_msg_description(excel_path, start_row, end_row)
-    results_description = requestor.batch_request(messages_description, provider="dify", key_index=0)
-    
-    print(f"\nResults: {len(results_description)} responses")
-    print(f"Metrics: {monitor.get_metrics().__dict__}")
-    print(f"======= ====== =======")
-    print(f"{results_description}\n")
+    stage_config = config.case_config.get('pipeline')
+    if stage_config:
+        # 案件入库并建立实体索引，关系阶段只附带共享人员或地点的已有案件
+        storage = CaseStorage(config.case_config['storage_path'],
+                              config.case_config.get('segment_max_bytes', 64 * 1024 * 1024),
+                              config.case_config.get('storage_flush_every', 100),
+                              validation_processes=config.case_config.get('validation_processes', 0),
+                              validation_chunk_size=config.case_config.get('validation_chunk_size', 500))
+        index = EntityIndex(Path(config.case_config['storage_path']) / "entities.jsonl")
+        if not len(index):
+            index.rebuild(storage.iter_cases(raw=True))
+        builders = {"relationship": partial(build_relationship, storage=storage, index=index,
+                                            max_neighbors=config.case_config.get('max_related_cases', 20))}
+        results, stage_stats = run_pipeline(client, messages_description, stage_config, builders=builders)
+        storage.close()
+        index.close()
+        print(f"\nResults: {len(results)} items")
+        print(f"Stages: {stage_stats}")
+        print(f"Metrics: {monitor.get_metrics().to_dict()}")
+        print("======= ====== =======")
+        print(f"{results}\n")
+    else:
+        results_description = requestor.batch_request(messages_description, provider="dify", key_index=0,
+                                                      stage="description", journal=journal,
+                                                      packer=MessagePacker.from_config(client, config))
+
+        print(f"\nResults: {len(results_description)} responses")
+        print(f"Metrics: {monitor.get_metrics().to_dict()}")
+        print("======= ====== =======")
+        print(f"{results_description}\n")
+
+    client.close()
+    if journal is not None:
+        journal.close()
+    if monitor_config.get('snapshot_path'):
+        monitor.stop_snapshots(monitor_config['snapshot_path'])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,51 @@
-from dataclasses import dataclass
-from collections import defaultdict
+import copy
+import hashlib
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Dict, Optional
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图，相对误差约为 growth - 1"""
+    MIN_VALUE = 0.001  # 1ms
+    GROWTH = 1.2
+    BUCKETS = 80  # 覆盖到约 2 小时
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)  # 最后一个桶收纳溢出值
+        self.count = 0
+        self.sum = 0.0
+
+    @classmethod
+    def upper_bound(cls, index: int) -> float:
+        if index >= cls.BUCKETS:
+            return math.inf
+        return cls.MIN_VALUE * cls.GROWTH ** index
+
+    def observe(self, value: float):
+        if value <= self.MIN_VALUE:
+            index = 0
+        else:
+            index = min(math.ceil(math.log(value / self.MIN_VALUE, self.GROWTH)), self.BUCKETS)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q: float) -> float:
+        """返回第 q 分位（0-1）所在桶的上界"""
+        if self.count == 0:
+            return 0.0
+        rank = max(math.ceil(q * self.count), 1)
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return self.upper_bound(min(index, self.BUCKETS - 1))
+        return self.upper_bound(self.BUCKETS - 1)
 
 @dataclass
 class PerformanceMetrics:
@@ -7,6 +53,24 @@ class PerformanceMetrics:
     success_requests: int = 0
     error_requests: int = 0
     total_response_time: float = 0.0
+    first_token_requests: int = 0
+    total_first_token_time: float = 0.0
+    coalesced_requests: int = 0
+    packed_messages: int = 0
+    pack_fallbacks: int = 0
+    hedged_requests: int = 0
+    hedge_wins: int = 0
+    retried_requests: int = 0
+    retry_attempts: int = 0
+    total_backoff_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    near_hits: int = 0
+    in_flight: int = 0
+    concurrency_limit: int = 0
+    error_codes: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram, repr=False)
+    completions: deque = field(default_factory=deque, repr=False)
 
     @property
     def avg_response_time(self):
@@ -14,28 +78,295 @@ class PerformanceMetrics:
             return 0.0
         return self.total_response_time / self.total_requests
 
+    @property
+    def avg_first_token_time(self):
+        if self.first_token_requests == 0:
+            return 0.0
+        return self.total_first_token_time / self.first_token_requests
+
+    @property
+    def cache_hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    def percentile(self, q: float) -> float:
+        return self.latency.percentile(q)
+
+    def throughput(self, window: float) -> float:
+        """最近 window 秒内每秒完成的请求数"""
+        cutoff = time.time() - window
+        return sum(1 for ts in self.completions if ts >= cutoff) / window
+
+    def to_dict(self, window: float = 60.0) -> dict:
+        return {
+            "total_requests": self.total_requests,
+            "success_requests": self.success_requests,
+            "error_requests": self.error_requests,
+            "avg_response_time": self.avg_response_time,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "avg_first_token_time": self.avg_first_token_time,
+            "coalesced_requests": self.coalesced_requests,
+            "packed_messages": self.packed_messages,
+            "pack_fallbacks": self.pack_fallbacks,
+            "hedged_requests": self.hedged_requests,
+            "hedge_wins": self.hedge_wins,
+            "retried_requests": self.retried_requests,
+            "retry_attempts": self.retry_attempts,
+            "total_backoff_time": self.total_backoff_time,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hit_rate,
+            "near_hits": self.near_hits,
+            "in_flight": self.in_flight,
+            "concurrency_limit": self.concurrency_limit,
+            "error_codes": dict(self.error_codes),
+            "throughput": self.throughput(window),
+        }
+
+def mask_key(api_key: Optional[str]) -> Optional[str]:
+    """指标标签与快照中只保留 Key 的前缀，附加短哈希区分前缀相同的 Key"""
+    if api_key is None:
+        return None
+    digest = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:8]
+    return f"{api_key[:6]}***{digest}"
+
 class PerformanceMonitor:
-    def __init__(self):
+    """线程安全的指标收集：全局、按供应商、按 Key 三个维度，缓存命中另按阶段统计"""
+
+    def __init__(self, throughput_window: float = 60.0):
+        self.throughput_window = throughput_window
         self.global_metrics = PerformanceMetrics()
         self.provider_metrics = defaultdict(PerformanceMetrics)
-    
-    def record_request(self, provider, success, response_time):
-        self.global_metrics.total_requests += 1
-        if success:
-            self.global_metrics.success_requests += 1
-        else:
-            self.global_metrics.error_requests += 1
-        self.global_metrics.total_response_time += response_time
+        self.key_metrics = defaultdict(PerformanceMetrics)
+        self.stage_metrics = defaultdict(PerformanceMetrics)
+        self._lock = threading.Lock()
+        self._snapshot_thread = None
+        self._snapshot_stop = threading.Event()
 
-        provider_metrics = self.provider_metrics[provider]
-        provider_metrics.total_requests += 1
-        if success:
-            provider_metrics.success_requests += 1
-        else:
-            provider_metrics.error_requests += 1
-        provider_metrics.total_response_time += response_time
-    
-    def get_metrics(self, provider=None):
-        if provider:
-            return self.provider_metrics.get(provider, PerformanceMetrics())
-        return self.global_metrics
\ No newline at end of file
+    def _targets(self, provider, key=None):
+        targets = [self.global_metrics, self.provider_metrics[provider]]
+        if key is not None:
+            targets.append(self.key_metrics[(provider, key)])
+        return targets
+
+    def record_start(self, provider, key=None):
+        """请求开始（含限流排队），用于在途请求数"""
+        with self._lock:
+            for metrics in self._targets(provider, key):
+                metrics.in_flight += 1
+
+    def record_cancelled(self, provider, key=None):
+        """请求被取消，只回收在途计数"""
+        with self._lock:
+            for metrics in self._targets(provider, key):
+                metrics.in_flight = max(metrics.in_flight - 1, 0)
+
+    def record_request(self, provider, success, response_time, key=None, status=None):
+        """记录请求结果；给出 key 时同时回收 record_start 登记的在途计数"""
+        now = time.time()
+        cutoff = now - self.throughput_window
+        with self._lock:
+            for metrics in self._targets(provider, key):
+                metrics.total_requests += 1
+                if success:
+                    metrics.success_requests += 1
+                else:
+                    metrics.error_requests += 1
+                    metrics.error_codes[str(status) if status is not None else "network"] += 1
+                metrics.total_response_time += response_time
+                metrics.latency.observe(response_time)
+                if key is not None:
+                    metrics.in_flight = max(metrics.in_flight - 1, 0)
+                metrics.completions.append(now)
+                while metrics.completions and metrics.completions[0] < cutoff:
+                    metrics.completions.popleft()
+
+    def record_first_token(self, provider, first_token_time):
+        """记录流式请求的首个增量到达耗时 (TTFT)"""
+        with self._lock:
+            for metrics in self._targets(provider):
+                metrics.first_token_requests += 1
+                metrics.total_first_token_time += first_token_time
+
+    def record_concurrency(self, provider, key, limit):
+        """记录 Key 的自适应并发上限，供应商与全局维度为各 Key 上限之和"""
+        with self._lock:
+            self.key_metrics[(provider, key)].concurrency_limit = limit
+            self.provider_metrics[provider].concurrency_limit = sum(
+                metrics.concurrency_limit for (name, _), metrics in self.key_metrics.items() if name == provider)
+            self.global_metrics.concurrency_limit = sum(
+                metrics.concurrency_limit for metrics in self.provider_metrics.values())
+
+    def record_coalesced(self, provider):
+        """记录被合并到同键在途请求上的重复调用"""
+        with self._lock:
+            for metrics in self._targets(provider):
+                metrics.coalesced_requests += 1
+
+    def record_packed(self, provider, messages, fallbacks=0):
+        """记录打包请求：合并发送的消息数与拆分失败后单独重发的消息数"""
+        with self._lock:
+            for metrics in self._targets(provider):
+                metrics.packed_messages += messages
+                metrics.pack_fallbacks += fallbacks
+
+    def record_hedge(self, provider):
+        """记录一次对冲请求；对冲副本本身的延迟与结果仍由 record_request 计入"""
+        with self._lock:
+            for metrics in self._targets(provider):
+                metrics.hedged_requests += 1
+
+    def record_hedge_win(self, provider):
+        """记录对冲副本先于原请求成功返回"""
+        with self._lock:
+            for metrics in self._targets(provider):
+                metrics.hedge_wins += 1
+
+    def record_retry(self, provider, attempts, backoff_time):
+        """记录一次经过重试的请求：重试次数与累计退避时间"""
+        with self._lock:
+            for metrics in self._targets(provider):
+                metrics.retried_requests += 1
+                metrics.retry_attempts += attempts
+                metrics.total_backoff_time += backoff_time
+
+    def record_cache(self, provider, hit, stage=None, near=False):
+        """记录缓存查询；near=True 表示由近似重复索引命中"""
+        with self._lock:
+            targets = self._targets(provider)
+            if stage is not None:
+                targets.append(self.stage_metrics[stage])
+            for metrics in targets:
+                if hit:
+                    metrics.cache_hits += 1
+                    if near:
+                        metrics.near_hits += 1
+                else:
+                    metrics.cache_misses += 1
+
+    def get_metrics(self, provider=None, key=None, stage=None):
+        """返回指标的一致性副本"""
+        with self._lock:
+            if stage:
+                metrics = self.stage_metrics.get(stage, PerformanceMetrics())
+            elif provider and key:
+                metrics = self.key_metrics.get((provider, key), PerformanceMetrics())
+            elif provider:
+                metrics = self.provider_metrics.get(provider, PerformanceMetrics())
+            else:
+                metrics = self.global_metrics
+            return copy.deepcopy(metrics)
+
+    def percentile(self, q, provider=None, key=None):
+        with self._lock:
+            if provider and key:
+                metrics = self.key_metrics.get((provider, key))
+            elif provider:
+                metrics = self.provider_metrics.get(provider)
+            else:
+                metrics = self.global_metrics
+            return metrics.percentile(q) if metrics is not None else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "global": self.global_metrics.to_dict(self.throughput_window),
+                "providers": {provider: metrics.to_dict(self.throughput_window)
+                              for provider, metrics in self.provider_metrics.items()},
+                "keys": {f"{provider}/{mask_key(key)}": metrics.to_dict(self.throughput_window)
+                         for (provider, key), metrics in self.key_metrics.items()},
+                "stages": {stage: metrics.to_dict(self.throughput_window)
+                           for stage, metrics in self.stage_metrics.items()},
+            }
+
+    def export_prometheus(self, prefix="llm") -> str:
+        """Prometheus 文本格式导出"""
+        lines = []
+        with self._lock:
+            series = [({"provider": provider}, metrics)
+                      for provider, metrics in self.provider_metrics.items()]
+            series += [({"provider": provider, "key": mask_key(key)}, metrics)
+                       for (provider, key), metrics in self.key_metrics.items()]
+
+            def labels(base, **extra):
+                merged = {**base, **extra}
+                return "{" + ",".join(f'{name}="{value}"' for name, value in merged.items()) + "}"
+
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for base, metrics in series:
+                lines.append(f"{prefix}_requests_total{labels(base, result='success')} {metrics.success_requests}")
+                lines.append(f"{prefix}_requests_total{labels(base, result='error')} {metrics.error_requests}")
+            lines.append(f"# TYPE {prefix}_request_errors_total counter")
+            for base, metrics in series:
+                for code, count in metrics.error_codes.items():
+                    lines.append(f"{prefix}_request_errors_total{labels(base, code=code)} {count}")
+            lines.append(f"# TYPE {prefix}_in_flight_requests gauge")
+            for base, metrics in series:
+                lines.append(f"{prefix}_in_flight_requests{labels(base)} {metrics.in_flight}")
+            lines.append(f"# TYPE {prefix}_concurrency_limit gauge")
+            for base, metrics in series:
+                lines.append(f"{prefix}_concurrency_limit{labels(base)} {metrics.concurrency_limit}")
+            lines.append(f"# TYPE {prefix}_throughput_rps gauge")
+            for base, metrics in series:
+                lines.append(f"{prefix}_throughput_rps{labels(base)} {metrics.throughput(self.throughput_window)}")
+            lines.append(f"# TYPE {prefix}_request_duration_seconds histogram")
+            for base, metrics in series:
+                cumulative = 0
+                for index, count in enumerate(metrics.latency.counts):
+                    cumulative += count
+                    bound = LatencyHistogram.upper_bound(index)
+                    le = "+Inf" if math.isinf(bound) else f"{bound:.6g}"
+                    if count or math.isinf(bound):
+                        lines.append(f"{prefix}_request_duration_seconds_bucket{labels(base, le=le)} {cumulative}")
+                lines.append(f"{prefix}_request_duration_seconds_sum{labels(base)} {metrics.latency.sum}")
+                lines.append(f"{prefix}_request_duration_seconds_count{labels(base)} {metrics.latency.count}")
+            provider_series = [s for s in series if "key" not in s[0]]
+            stage_series = [({"stage": stage}, metrics) for stage, metrics in self.stage_metrics.items()]
+            for name, attr in (("cache_hits_total", "cache_hits"),
+                               ("cache_misses_total", "cache_misses"),
+                               ("cache_near_hits_total", "near_hits")):
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for base, metrics in provider_series + stage_series:
+                    lines.append(f"{prefix}_{name}{labels(base)} {getattr(metrics, attr)}")
+            for name, attr in (("coalesced_requests_total", "coalesced_requests"),
+                               ("packed_messages_total", "packed_messages"),
+                               ("pack_fallbacks_total", "pack_fallbacks"),
+                               ("hedged_requests_total", "hedged_requests"),
+                               ("hedge_wins_total", "hedge_wins"),
+                               ("retry_attempts_total", "retry_attempts")):
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for base, metrics in provider_series:
+                    lines.append(f"{prefix}_{name}{labels(base)} {getattr(metrics, attr)}")
+        return "\n".join(lines) + "\n"
+
+    def start_snapshots(self, path, interval: float = 60.0):
+        """后台线程按间隔将 JSON 快照追加写入 path (JSON Lines)"""
+        if self._snapshot_thread is not None:
+            return
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._snapshot_stop.clear()
+
+        def run():
+            while not self._snapshot_stop.wait(interval):
+                self.write_snapshot(path)
+
+        self._snapshot_thread = threading.Thread(target=run, name="monitor-snapshot", daemon=True)
+        self._snapshot_thread.start()
+
+    def write_snapshot(self, path):
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+
+    def stop_snapshots(self, path=None):
+        """停止后台快照，给出 path 时再写入最后一次"""
+        if self._snapshot_thread is None:
+            return
+        self._snapshot_stop.set()
+        self._snapshot_thread.join()
+        self._snapshot_thread = None
+        if path is not None:
+            self.write_snapshot(path)
@@ -0,0 +1,129 @@
+import json
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+from .case.validation import extract_json
+from .ratelimit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PACK_HEADER = (
+    "以下共有 {count} 条相互独立的记录，每条记录以 <<<记录ID>>> 开头。\n"
+    "请对每条记录分别完成任务，只输出一个 JSON 对象：键为记录ID，值为该记录的完整回答（字符串）。\n"
+)
+
+def pack_id(position: int) -> str:
+    return f"r{position + 1}"
+
+def build_packed_prompt(messages: Sequence[str]) -> str:
+    """将多条消息拼成一个带固定分隔符与编号的提示词"""
+    parts = [PACK_HEADER.format(count=len(messages))]
+    for position, message in enumerate(messages):
+        parts.append(f"<<<{pack_id(position)}>>>\n{message}")
+    return "\n".join(parts)
+
+def split_packed_response(content: Optional[str], count: int) -> Dict[int, str]:
+    """按记录编号拆分打包请求的回答，返回 {位置: 内容}，缺失或无法解析的位置不出现在结果中"""
+    try:
+        data = extract_json(content or "")
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    answers = {}
+    for position in range(count):
+        value = data.get(pack_id(position))
+        if value is None or value == "":
+            continue
+        answers[position] = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return answers
+
+class MessagePacker:
+    """
+    将多条短消息按 Token 预算合并为一个请求（可选）
+
+    缓存与监控仍按原始消息计：每条消息单独查缓存、单独写缓存；
+    回答中缺失或无法解析的消息回退为单独请求
+    """
+
+    def __init__(self, client, token_budget: int = 2000, max_items: int = 20):
+        self.client = client
+        self.token_budget = token_budget
+        self.max_items = max_items
+
+    @classmethod
+    def from_config(cls, client, config):
+        options = config.api_config.get('packing') or {}
+        if not options.get('enabled'):
+            return None
+        return cls(client, options.get('token_budget', 2000), options.get('max_items', 20))
+
+    @staticmethod
+    def tokens(message: str) -> int:
+        return estimate_tokens(message.encode('utf-8'))
+
+    def fits(self, group: Sequence[str], message: str) -> bool:
+        """message 能否加入已有的一组消息；单条超出预算的消息自成一组"""
+        if not group:
+            return True
+        if len(group) >= self.max_items:
+            return False
+        return sum(map(self.tokens, group)) + self.tokens(message) <= self.token_budget
+
+    def _lookup(self, items, provider, stage, kwargs, api_key=None, key_index=None):
+        results, pending = {}, []
+        for index, message in items:
+            cache_key, _, cached, _ = self.client._lookup(provider, message, kwargs, stage, api_key, key_index)
+            if cached:
+                results[index] = cached
+            else:
+                pending.append((index, message, cache_key))
+        return results, pending
+
+    def _split(self, pending, packed, results) -> List[Tuple[int, str, str]]:
+        """拆分打包结果写入 results 与缓存，返回需要单独重发的消息"""
+        answers = split_packed_response(packed.get("content"), len(pending)) if packed["success"] else {}
+        fallbacks = []
+        for position, (index, message, cache_key) in enumerate(pending):
+            if position not in answers:
+                fallbacks.append((index, message, cache_key))
+                continue
+            result = self.client._success_result(packed["provider"], answers[position], None)
+            self.client.cache.set(cache_key, result)
+            results[index] = result
+        if fallbacks:
+            logger.warning(f"Packed request returned {len(pending) - len(fallbacks)}/{len(pending)} answers, "
+                           f"sending {len(fallbacks)} messages individually")
+        return fallbacks
+
+    def send(self, items: Sequence[Tuple[int, str]], provider: Optional[str] = None,
+             api_key: Optional[str] = None, key_index: Optional[int] = None,
+             stage: Optional[str] = None, **kwargs) -> List[Tuple[int, Dict]]:
+        """发送一组 (输入序号, 消息)，按输入顺序返回 (输入序号, 结果)"""
+        provider = self.client._resolve_provider(provider, api_key)
+        results, pending = self._lookup(items, provider, stage, kwargs, api_key, key_index)
+        fallbacks = pending
+        if len(pending) > 1:
+            prompt = build_packed_prompt([message for _, message, _ in pending])
+            # 合并后的回答不写缓存，只缓存拆分后的逐条结果
+            packed = self.client._send(prompt, provider, api_key, key_index, None, **kwargs)
+            fallbacks = self._split(pending, packed, results)
+            self.client.monitor.record_packed(provider, len(pending), len(fallbacks))
+        for index, message, cache_key in fallbacks:
+            results[index] = self.client._send(message, provider, api_key, key_index, cache_key, **kwargs)
+        return [(index, results[index]) for index, _ in items]
+
+    async def asend(self, items: Sequence[Tuple[int, str]], provider: Optional[str] = None,
+                    api_key: Optional[str] = None, key_index: Optional[int] = None,
+                    stage: Optional[str] = None, **kwargs) -> List[Tuple[int, Dict]]:
+        """send 的异步版本，client 为 AsyncAPIClient"""
+        provider = self.client._resolve_provider(provider, api_key)
+        results, pending = self._lookup(items, provider, stage, kwargs, api_key, key_index)
+        fallbacks = pending
+        if len(pending) > 1:
+            prompt = build_packed_prompt([message for _, message, _ in pending])
+            packed = await self.client._send(prompt, provider, api_key, key_index, None, **kwargs)
+            fallbacks = self._split(pending, packed, results)
+            self.client.monitor.record_packed(provider, len(pending), len(fallbacks))
+        for index, message, cache_key in fallbacks:
+            results[index] = await self.client._send(message, provider, api_key, key_index, cache_key, **kwargs)
+        return [(index, results[index]) for index, _ in items]
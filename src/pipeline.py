@@ -0,0 +1,142 @@
+import queue
+import time
+import logging
+import concurrent.futures
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .monitor import PerformanceMonitor
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Stage:
+    """
+    流水线中的一个阶段
+
+    build 接收上一阶段的结果（首个阶段接收输入项）并返回本阶段的请求消息，
+    返回 None 表示该项在此结束
+    """
+    name: str
+    build: Optional[Callable[[Any], Optional[str]]] = None
+    provider: Optional[str] = None
+    api_key: Optional[str] = None
+    key_index: Optional[int] = None
+    max_workers: int = 5
+    rpm: Optional[float] = None
+    kwargs: Dict = field(default_factory=dict)
+
+    @classmethod
+    def from_config(cls, name: str, build, options: Dict):
+        options = dict(options)
+        return cls(name=name, build=build, kwargs=options.pop('kwargs', {}), **options)
+
+class Pipeline:
+    """
+    多阶段流水线：单个输入项完成某阶段后立即进入下一阶段，无需等待整批完成
+
+    每个阶段有独立的线程池 (max_workers)、速率预算 (rpm) 和 PerformanceMonitor
+    """
+
+    def __init__(self, client, stages: List[Stage], window: Optional[int] = None):
+        if not stages:
+            raise ValueError("Pipeline requires at least one stage")
+        self.client = client
+        self.stages = stages
+        self.window = window or sum(stage.max_workers for stage in stages) * 2
+        self.monitors = {stage.name: PerformanceMonitor() for stage in stages}
+        self.buckets = {stage.name: TokenBucket(stage.rpm) if stage.rpm else None for stage in stages}
+        self.started_at = None
+
+    def _call(self, stage: Stage, message: str):
+        bucket = self.buckets[stage.name]
+        if bucket is not None:
+            wait = bucket.reserve(1)
+            if wait > 0:
+                time.sleep(wait)
+        start_time = time.time()
+        result = self.client.send_request(
+            message,
+            provider=stage.provider,
+            api_key=stage.api_key,
+            key_index=stage.key_index,
+            stage=stage.name,
+            **stage.kwargs
+        )
+        self.monitors[stage.name].record_request(
+            stage.provider or "default", result["success"], time.time() - start_time)
+        return result
+
+    def run(self, items: Iterable) -> Iterator[Tuple[int, Dict[str, Dict]]]:
+        """产出 (输入序号, {阶段名: 结果})，某项在任一阶段失败或被 build 跳过时提前产出"""
+        self.started_at = time.time()
+        events = queue.Queue()
+        executors = [concurrent.futures.ThreadPoolExecutor(max_workers=stage.max_workers,
+                                                           thread_name_prefix=f"stage-{stage.name}")
+                     for stage in self.stages]
+        source = enumerate(items)
+        outputs = {}
+
+        def submit(index, position, payload):
+            stage = self.stages[position]
+            try:
+                message = stage.build(payload) if stage.build else payload
+            except Exception as e:
+                logger.error(f"Stage {stage.name} failed to build message: {str(e)}")
+                message = None
+            if message is None:
+                return False
+            future = executors[position].submit(self._call, stage, message)
+            future.add_done_callback(lambda f: events.put((index, position, f)))
+            return True
+
+        def fill():
+            while len(outputs) < self.window:
+                item = next(source, None)
+                if item is None:
+                    return
+                index, payload = item
+                outputs[index] = {}
+                if not submit(index, 0, payload):
+                    yield index, outputs.pop(index)
+
+        try:
+            yield from fill()
+            while outputs:
+                index, position, future = events.get()
+                stage = self.stages[position]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Stage {stage.name} request failed: {str(e)}")
+                    result = {"provider": stage.provider, "error": str(e), "success": False}
+                outputs[index][stage.name] = result
+                next_position = position + 1
+                if (not result["success"] or next_position >= len(self.stages)
+                        or not submit(index, next_position, result)):
+                    yield index, outputs.pop(index)
+                    yield from fill()
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Dict]:
+        """每个阶段的吞吐量、延迟与缓存命中率"""
+        elapsed = max(time.time() - self.started_at, 1e-9) if self.started_at else None
+        stats = {}
+        for stage in self.stages:
+            metrics = self.monitors[stage.name].get_metrics()
+            cache = self.client.monitor.get_metrics(stage=stage.name)
+            stats[stage.name] = {
+                "completed": metrics.total_requests,
+                "success": metrics.success_requests,
+                "errors": metrics.error_requests,
+                "avg_latency": metrics.avg_response_time,
+                "p50": metrics.percentile(0.5),
+                "p95": metrics.percentile(0.95),
+                "p99": metrics.percentile(0.99),
+                "throughput": metrics.total_requests / elapsed if elapsed else 0.0,
+                "cache_hit_rate": cache.cache_hit_rate,
+                "near_hits": cache.near_hits,
+            }
+        return stats
@@ -0,0 +1,78 @@
+import re
+import json
+import time
+import threading
+from typing import Dict, Optional, Union
+
+_CJK = re.compile(r'[　-〿一-鿿＀-￯]')
+
+def estimate_tokens(payload: Union[dict, bytes], max_tokens: Optional[int] = None) -> int:
+    """粗略估算请求占用的 Token：中日韩字符按 1 个计，其余按 4 字符 1 个计，并加上 max_tokens"""
+    if isinstance(payload, bytes):
+        text = payload.decode('utf-8')
+    else:
+        text = json.dumps(payload, ensure_ascii=False)
+        if max_tokens is None:
+            max_tokens = payload.get('max_tokens', 0)
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1 + int(max_tokens or 0)
+
+class TokenBucket:
+    """令牌桶，rate 为每分钟补充量，capacity 为突发上限（默认 10 秒的量）"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(per_minute / 6.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        """预占 amount 个令牌并返回需要等待的秒数；允许透支，按预占顺序排队"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+class RateLimiter:
+    """按供应商与 Key 声明的 RPM/TPM 限额，请求前预占容量"""
+
+    def __init__(self, providers: Dict):
+        self.provider_buckets = {}
+        self.key_buckets = {}
+        for provider, config in providers.items():
+            self.provider_buckets[provider] = self._make_buckets(config.get('rate_limit'))
+            key_limits = config.get('key_rate_limit')
+            for index, key in enumerate(config['keys']):
+                limits = key_limits[index] if isinstance(key_limits, list) else key_limits
+                self.key_buckets[(provider, key)] = self._make_buckets(limits)
+
+    @staticmethod
+    def _make_buckets(limits: Optional[Dict]):
+        limits = limits or {}
+        return (
+            TokenBucket(limits['rpm'], limits.get('rpm_burst')) if limits.get('rpm') else None,
+            TokenBucket(limits['tpm'], limits.get('tpm_burst')) if limits.get('tpm') else None,
+        )
+
+    def reserve(self, provider: str, api_key: str, tokens: int) -> float:
+        """预占一次请求及其 Token 的容量，返回需要等待的秒数"""
+        wait = 0.0
+        for rpm, tpm in (self.provider_buckets.get(provider, (None, None)),
+                         self.key_buckets.get((provider, api_key), (None, None))):
+            if rpm is not None:
+                wait = max(wait, rpm.reserve(1))
+            if tpm is not None:
+                wait = max(wait, tpm.reserve(tokens))
+        return wait
+
+    def acquire(self, provider: str, api_key: str, tokens: int) -> float:
+        """阻塞直到容量可用，返回实际等待的秒数"""
+        wait = self.reserve(provider, api_key, tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -1,61 +1,318 @@
+import asyncio
+import collections
 import concurrent.futures
-from typing import List, Optional, Dict
+from typing import AsyncIterator, Callable, Iterable, Iterator, List, Optional, Dict, Tuple
 import threading
-import logger
+import logging
+from .journal import CheckpointJournal
+from .packing import MessagePacker
+from .result import RequestResult
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[Dict, int, Dict], None]
+
+def _initial_progress(messages) -> Dict:
+    # 生成器等无长度输入的 total 随提交数增长
+    total = len(messages) if hasattr(messages, '__len__') else 0
+    return {'total': total, 'completed': 0, 'success': 0, 'in_flight': 0, 'resumed': 0}
+
+def _failed_result(provider, error) -> Dict:
+    return RequestResult(provider, success=False, error=str(error))
+
+def _group_results(entries, future, packer, provider):
+    """展开一个已完成的请求（打包时包含多条消息），产出 (输入序号, 消息哈希, 结果)"""
+    digests = dict(entries)
+    try:
+        results = future.result()
+        if packer is None:
+            results = [(entries[0][0], results)]
+    except Exception as e:
+        logger.error(f"Request failed: {str(e)}")
+        results = [(index, _failed_result(provider, e)) for index, _ in entries]
+    for index, result in results:
+        yield index, digests[index], result
+
+class _RequestWindow:
+    """
+    iter_request 的窗口、顺序、检查点恢复与打包记账，同步与异步协调器共用，
+    各自只负责提交请求与等待完成；submit(group) 返回 Future 或 Task
+    """
+
+    def __init__(self, coordinator, messages, window, ordered, progress_callback,
+                 journal, resume, retry_failed, packer, provider):
+        self.coordinator = coordinator
+        self.window = window
+        self.ordered = ordered
+        self.progress_callback = progress_callback
+        self.journal = journal
+        self.retry_failed = retry_failed
+        self.packer = packer
+        self.provider = provider
+        coordinator.progress = _initial_progress(messages)
+        self.completed = journal.load() if journal is not None and resume else {}
+        self.source = enumerate(messages)
+        self.pending = {}
+        self.ready = collections.deque()
+        self.buffered = {}
+        self.next_index = 0
+
+    def deliver(self, index, result):
+        if self.ordered:
+            self.buffered[index] = result
+        else:
+            self.ready.append((index, result))
+
+    def has_ready(self) -> bool:
+        return bool(self.ready) or self.next_index in self.buffered
+
+    def pop_ready(self) -> Iterator[Tuple[int, Dict]]:
+        """取出可以产出的结果，ordered=True 时只取到第一个缺口之前"""
+        while self.ready:
+            yield self.ready.popleft()
+        while self.next_index in self.buffered:
+            index = self.next_index
+            self.next_index += 1
+            yield index, self.buffered.pop(index)
+
+    def _add(self, handle, group):
+        self.pending[handle] = [(index, digest) for index, _, digest in group]
+        with self.coordinator.lock:
+            self.coordinator.progress['in_flight'] += len(group)
+
+    def fill(self, submit):
+        """从输入中补充请求直到窗口占满，检查点中已完成的请求直接复用结果"""
+        journal, packer, progress = self.journal, self.packer, self.coordinator.progress
+        group = []
+        while sum(map(len, self.pending.values())) + len(group) + len(self.ready) + len(self.buffered) < self.window:
+            item = next(self.source, None)
+            if item is None:
+                break
+            index, message = item
+            with self.coordinator.lock:
+                progress['total'] = max(progress['total'], index + 1)
+            digest = CheckpointJournal.message_hash(message) if journal is not None else None
+            entry = self.completed.pop(index, None)
+            if journal is not None and journal.is_done(entry, digest, self.retry_failed):
+                self._update_progress(index, entry['result'], resumed=True)
+                self.deliver(index, entry['result'])
+                continue
+            if group and (packer is None or not packer.fits([m for _, m, _ in group], message)):
+                self._add(submit(group), group)
+                group = []
+            group.append((index, message, digest))
+        if group:
+            self._add(submit(group), group)
+
+    def complete(self, handle):
+        """处理一个已完成的 Future 或 Task：写入检查点、更新进度并等待产出"""
+        for index, digest, result in _group_results(self.pending.pop(handle), handle, self.packer, self.provider):
+            if self.journal is not None:
+                self.journal.record(index, digest, result)
+            with self.coordinator.lock:
+                self.coordinator.progress['in_flight'] -= 1
+            self._update_progress(index, result)
+            self.deliver(index, result)
+
+    def _update_progress(self, index, result, resumed=False):
+        coordinator = self.coordinator
+        with coordinator.lock:
+            coordinator.progress['completed'] += 1
+            if resumed:
+                coordinator.progress['resumed'] += 1
+            if result["success"]:
+                coordinator.progress['success'] += 1
+            progress = coordinator.progress.copy()
+        if self.progress_callback is not None:
+            self.progress_callback(progress, index, result)
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.sync()
 
 class RequestCoordinator:
     def __init__(self, client, max_workers=5):
         self.client = client
         self.max_workers = max_workers
         self.lock = threading.Lock()
-        self.progress = {'total': 0, 'completed': 0, 'success': 0}
+        self.progress = _initial_progress(())
         self.results = []
-            
+
     def batch_request(
         self,
-        messages: List[str],
+        messages: Iterable[str],
         provider: Optional[str] = None,
         api_key: Optional[str] = None,
         key_index: Optional[int] = None,
+        journal: Optional[CheckpointJournal] = None,
+        packer: Optional[MessagePacker] = None,
         **kwargs
     ) -> List[Dict]:
-        self.progress = {'total': len(messages), 'completed': 0, 'success': 0}
-        self.results = []
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {
-                executor.submit(
-                    self._process_request,
-                    message,
-                    provider,
-                    api_key,
-                    key_index,
-                    **kwargs
-                ): message for message in messages
-            }
-            
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    result = future.result()
-                    self.results.append(result)
-                except Exception as e:
-                    logger.error(f"Request failed: {str(e)}")
-                        
+        """执行整批请求，按输入顺序返回结果"""
+        self.results = [
+            result for _, result in self.iter_request(
+                messages, provider, api_key, key_index, ordered=True, journal=journal,
+                packer=packer, **kwargs)
+        ]
         return self.results
-    
+
+    def iter_request(
+        self,
+        messages: Iterable[str],
+        provider: Optional[str] = None,
+        api_key: Optional[str] = None,
+        key_index: Optional[int] = None,
+        ordered: bool = False,
+        window: Optional[int] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        journal: Optional[CheckpointJournal] = None,
+        resume: bool = True,
+        retry_failed: bool = True,
+        packer: Optional[MessagePacker] = None,
+        **kwargs
+    ) -> Iterator[Tuple[int, Dict]]:
+        """
+        流式执行请求，产出 (输入序号, 结果)
+
+        最多同时持有 window 个未产出的请求（默认 max_workers 的两倍），
+        ordered=True 时按输入顺序产出，否则按完成顺序产出。
+        给出 journal 时每个完成的请求都写入检查点；resume=True 时跳过检查点中
+        序号与消息哈希都一致的已完成请求，retry_failed=True 时重跑其中失败的请求。
+        给出 packer 时相邻的短消息按 Token 预算合并为一个请求，window 按消息条数计
+        """
+        state = _RequestWindow(
+            self, messages, window or self.max_workers * 2 * (packer.max_items if packer else 1), ordered,
+            progress_callback, journal, resume, retry_failed, packer, provider)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+
+        def submit(group):
+            if packer is not None:
+                return executor.submit(packer.send, [(index, message) for index, message, _ in group],
+                                       provider, api_key, key_index, **kwargs)
+            return executor.submit(self._process_request, group[0][1], provider, api_key, key_index, **kwargs)
+
+        try:
+            while True:
+                yield from state.pop_ready()
+                state.fill(submit)
+                if state.has_ready():
+                    continue
+                if not state.pending:
+                    break
+                done, _ = concurrent.futures.wait(
+                    state.pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    state.complete(future)
+        finally:
+            # 调用方提前停止迭代时丢弃尚未开始的请求
+            executor.shutdown(wait=True, cancel_futures=True)
+            state.close()
+
     def _process_request(self, message, provider, api_key, key_index, **kwargs):
-        result = self.client.send_request(
+        return self.client.send_request(
             message,
             provider=provider,
             api_key=api_key,
             key_index=key_index,
             **kwargs
         )
+
+    def get_progress(self):
         with self.lock:
-            self.progress['completed'] += 1
-            if result["success"]:
-                self.progress['success'] += 1
-        return result
+            return self.progress.copy()
+
+class AsyncRequestCoordinator:
+    """单事件循环上的并发请求协调器，并发度由信号量控制而非线程数"""
+
+    def __init__(self, client, max_concurrency=100):
+        self.client = client
+        self.max_concurrency = max_concurrency
+        # 只在事件循环线程中使用，与同步协调器共用 _RequestWindow 的进度记账
+        self.lock = threading.Lock()
+        self.progress = _initial_progress(())
+        self.results = []
+
+    async def batch_request(
+        self,
+        messages: Iterable[str],
+        provider: Optional[str] = None,
+        api_key: Optional[str] = None,
+        key_index: Optional[int] = None,
+        journal: Optional[CheckpointJournal] = None,
+        packer: Optional[MessagePacker] = None,
+        **kwargs
+    ) -> List[Dict]:
+        """执行整批请求，按输入顺序返回结果"""
+        self.results = [
+            result async for _, result in self.iter_request(
+                messages, provider, api_key, key_index, ordered=True, journal=journal,
+                packer=packer, **kwargs)
+        ]
+        return self.results
+
+    async def iter_request(
+        self,
+        messages: Iterable[str],
+        provider: Optional[str] = None,
+        api_key: Optional[str] = None,
+        key_index: Optional[int] = None,
+        ordered: bool = False,
+        window: Optional[int] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        journal: Optional[CheckpointJournal] = None,
+        resume: bool = True,
+        retry_failed: bool = True,
+        packer: Optional[MessagePacker] = None,
+        **kwargs
+    ) -> AsyncIterator[Tuple[int, Dict]]:
+        """RequestCoordinator.iter_request 的异步版本，在途请求数不超过 max_concurrency"""
+        state = _RequestWindow(
+            self, messages, window or self.max_concurrency * 2 * (packer.max_items if packer else 1), ordered,
+            progress_callback, journal, resume, retry_failed, packer, provider)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def bounded(group):
+            async with semaphore:
+                if packer is not None:
+                    return await packer.asend([(index, message) for index, message, _ in group],
+                                              provider, api_key, key_index, **kwargs)
+                return await self._process_request(group[0][1], provider, api_key, key_index, **kwargs)
+
+        try:
+            while True:
+                for item in state.pop_ready():
+                    yield item
+                state.fill(lambda group: asyncio.ensure_future(bounded(group)))
+                if state.has_ready():
+                    continue
+                if not state.pending:
+                    break
+                done, _ = await asyncio.wait(state.pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    state.complete(task)
+        finally:
+            for task in state.pending:
+                task.cancel()
+            state.close()
+
+    def run_batch(self, messages: Iterable[str], **kwargs) -> List[Dict]:
+        """同步调用入口：在新的事件循环中执行 batch_request 并释放会话"""
+        async def runner():
+            try:
+                return await self.batch_request(messages, **kwargs)
+            finally:
+                await self.client.aclose()
+        return asyncio.run(runner())
+
+    async def _process_request(self, message, provider, api_key, key_index, **kwargs):
+        return await self.client.send_request(
+            message,
+            provider=provider,
+            api_key=api_key,
+            key_index=key_index,
+            **kwargs
+        )
 
     def get_progress(self):
-        return self.progress.copy()
\ No newline at end of file
+        with self.lock:
+            return self.progress.copy()
@@ -0,0 +1,248 @@
+import os
+import sys
+import time
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+from .adapters.base import dumps_bytes, loads_bytes
+
+RAW_MODES = ("full", "truncate", "disk", "off")
+
+class RawRef(NamedTuple):
+    """溢出到磁盘的 raw 响应位置"""
+    path: str
+    offset: int
+    length: int
+
+    def read(self) -> Optional[bytes]:
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                data = f.read(self.length)
+        except OSError:
+            return None
+        return data if len(data) == self.length else None
+
+class RawSpillStore:
+    """
+    raw 响应追加写入的溢出文件，结果中只保留 RawRef
+
+    每个进程写自己的分段文件，超过 segment_bytes 时换新文件；目录中的分段总大小超过 max_bytes
+    或存在时间超过 max_age 时删除最早的分段，其中的 raw 读取时返回 None（content 等字段不受影响）
+    """
+
+    def __init__(self, directory, max_bytes: int = 1024 * 1024 * 1024, segment_bytes: int = 64 * 1024 * 1024,
+                 max_age: Optional[float] = None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.max_age = max_age
+        self.path = None
+        self._file = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self.cleanup()
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._sequence += 1
+        self.path = self.directory / f"raw-{os.getpid()}-{int(time.time())}-{self._sequence:04d}.bin"
+        self._file = open(self.path, 'ab')
+        self.cleanup()
+
+    def cleanup(self):
+        """删除过期分段，并按修改时间从旧到新删除超出 max_bytes 的分段（不删除正在写入的分段）"""
+        segments = []
+        for segment in self.directory.glob("raw-*.bin"):
+            try:
+                stat = segment.stat()
+            except OSError:
+                continue
+            segments.append((stat.st_mtime, stat.st_size, segment))
+        segments.sort()
+        total = sum(size for _, size, _ in segments)
+        now = time.time()
+        for mtime, size, segment in segments:
+            if segment == self.path:
+                continue
+            expired = self.max_age is not None and now - mtime > self.max_age
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                segment.unlink()
+            except OSError:
+                continue
+            total -= size
+
+    def append(self, data: bytes) -> RawRef:
+        with self._lock:
+            if self._file is None or 0 < self._file.tell() and self._file.tell() + len(data) > self.segment_bytes:
+                self._rotate()
+            offset = self._file.tell()
+            self._file.write(data)
+            # 写入后立即 flush，其他线程可随时按位置读取
+            self._file.flush()
+            return RawRef(str(self.path), offset, len(data))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+class RawRetention:
+    """
+    raw 响应的保留方式：full 保留序列化后的字节，访问时才解析；truncate 只保留前 max_bytes 字节
+    （访问时为字符串）；disk 写入溢出文件，访问时读回；off 不保留
+    """
+
+    def __init__(self, mode: str = "full", max_bytes: int = 2048, path: Optional[str] = None,
+                 store: Optional[Dict] = None):
+        if mode not in RAW_MODES:
+            raise ValueError(f"Unknown raw retention mode {mode}, expected one of {RAW_MODES}")
+        if mode == "disk" and not path:
+            raise ValueError("Raw retention mode disk requires a path")
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.store = RawSpillStore(path, **(store or {})) if mode == "disk" else None
+
+    @classmethod
+    def from_config(cls, config):
+        options = config.api_config.get('results') or {}
+        store = {
+            "max_bytes": options.get('raw_disk_max_bytes', 1024 * 1024 * 1024),
+            "segment_bytes": options.get('raw_segment_bytes', 64 * 1024 * 1024),
+            # 溢出文件最多保留磁盘缓存的有效期，过期的缓存条目不会再引用它们
+            "max_age": (config.api_config.get('cache') or {}).get('disk_ttl'),
+        }
+        return cls(options.get('raw', 'full'), options.get('raw_max_bytes', 2048), options.get('raw_path'), store)
+
+    def keep(self, raw):
+        """raw 为响应字节或已解析的对象，返回 RequestResult 中保存的形式"""
+        if raw is None or self.mode == "off":
+            return None
+        data = raw if isinstance(raw, bytes) else dumps_bytes(raw)
+        if self.mode == "truncate" and len(data) > self.max_bytes:
+            return data[:self.max_bytes].decode('utf-8', 'ignore')
+        if self.mode == "disk":
+            return self.store.append(data)
+        return data
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+class RequestResult(Mapping):
+    """
+    紧凑的请求结果，兼容原有的字典用法（result["content"]、result.get("raw")、{**result}）
+
+    成功结果的键为 provider/content/raw/success，失败结果为 provider/error/success，
+    近似重复等附加字段放在 extra 中。raw 按 RawRetention 保存，读取时才反序列化
+    """
+    __slots__ = ("provider", "content", "success", "error", "_raw", "_extra")
+
+    def __init__(self, provider: str, content=None, success: bool = True, error: Optional[str] = None,
+                 raw=None, extra: Optional[Dict] = None):
+        self.provider = provider
+        self.content = content
+        self.success = success
+        self.error = error
+        self._raw = raw
+        self._extra = extra
+
+    @property
+    def raw(self):
+        raw = self._raw
+        if isinstance(raw, RawRef):
+            raw = raw.read()
+        if isinstance(raw, bytes):
+            return loads_bytes(raw)
+        return raw
+
+    def _keys(self):
+        keys = ("provider", "content", "raw", "success") if self.success else ("provider", "error", "success")
+        return keys + tuple(self._extra) if self._extra else keys
+
+    def __getitem__(self, key):
+        if key in ("provider", "success") or key == ("content" if self.success else "error"):
+            return getattr(self, key)
+        if key == "raw" and self.success:
+            return self.raw
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def with_fields(self, **fields) -> "RequestResult":
+        """返回附加了字段的副本，raw 不复制"""
+        return RequestResult(self.provider, self.content, self.success, self.error, self._raw,
+                             {**(self._extra or {}), **fields})
+
+    @property
+    def nbytes(self) -> int:
+        """估算占用的内存字节数，用于按字节限制缓存"""
+        size = sys.getsizeof(self) + sys.getsizeof(self.content) + sys.getsizeof(self.error)
+        if isinstance(self._raw, (bytes, str)):
+            size += sys.getsizeof(self._raw)
+        elif isinstance(self._raw, RawRef):
+            size += sys.getsizeof(self._raw) + sys.getsizeof(self._raw.path)
+        elif self._raw is not None:
+            size += len(dumps_bytes(self._raw))
+        if self._extra:
+            size += len(dumps_bytes(self._extra))
+        return size
+
+    def to_dict(self) -> Dict:
+        """
+        可 JSON 序列化的字典，用于检查点与磁盘缓存。raw 不经解析直接写出：
+        响应字节写为 raw_json 字符串，截断的文本写为 raw_text，溢出到磁盘的只记录 raw_ref
+        """
+        if self.success:
+            data = {"provider": self.provider, "content": self.content, "success": True}
+        else:
+            data = {"provider": self.provider, "error": self.error, "success": False}
+        raw = self._raw
+        if isinstance(raw, bytes):
+            data["raw_json"] = raw.decode('utf-8')
+        elif isinstance(raw, str):
+            data["raw_text"] = raw
+        elif isinstance(raw, RawRef):
+            data["raw_ref"] = list(raw)
+        elif self.success:
+            data["raw"] = raw
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RequestResult":
+        fields = dict(data)
+        provider = fields.pop("provider", None)
+        success = bool(fields.pop("success", False))
+        content = fields.pop("content", None)
+        error = fields.pop("error", None)
+        raw = fields.pop("raw", None)
+        raw_json = fields.pop("raw_json", None)
+        raw_text = fields.pop("raw_text", None)
+        raw_ref = fields.pop("raw_ref", None)
+        if raw_json is not None:
+            raw = raw_json.encode('utf-8')
+        elif raw_text is not None:
+            raw = raw_text
+        elif raw_ref is not None:
+            raw = RawRef(*raw_ref)
+        elif raw is not None and not isinstance(raw, str):
+            # 旧格式的检查点与缓存中 raw 为已解析的对象
+            raw = dumps_bytes(raw)
+        return cls(provider, content, success, error, raw, fields or None)
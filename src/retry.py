@@ -0,0 +1,81 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+import requests
+
+try:
+    import aiohttp
+    _NETWORK_ERRORS = (requests.RequestException, aiohttp.ClientConnectionError,
+                       aiohttp.ClientPayloadError, ConnectionError, TimeoutError)
+except ImportError:  # aiohttp 仅异步客户端需要
+    _NETWORK_ERRORS = (requests.RequestException, ConnectionError, TimeoutError)
+
+RETRYABLE = "retryable"
+RATE_LIMITED = "rate_limited"
+FATAL = "fatal"
+
+def error_status(error: Exception) -> Optional[int]:
+    """从 requests/aiohttp 异常中提取 HTTP 状态码"""
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if status is not None else getattr(error, 'status', None)
+
+def error_headers(error: Exception):
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    return headers if headers is not None else getattr(error, 'headers', None)
+
+class RetryPolicy:
+    """错误分类 + 指数退避 (full jitter)，限流时优先遵循 Retry-After"""
+    RETRYABLE_STATUS = {408, 409, 425, 500, 502, 503, 504}
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=30.0,
+                 max_retry_after=120.0, failover=True):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.failover = failover
+
+    @classmethod
+    def from_config(cls, config):
+        options = dict(config.api_config.get('retry', {}))
+        options.setdefault('max_retries', config.case_config.get('max_retries', 3))
+        return cls(**options)
+
+    def classify(self, error: Exception) -> str:
+        status = error_status(error)
+        if status == 429:
+            return RATE_LIMITED
+        if status is not None:
+            return RETRYABLE if status in self.RETRYABLE_STATUS or status >= 500 else FATAL
+        if isinstance(error, _NETWORK_ERRORS):
+            return RETRYABLE
+        return FATAL
+
+    def should_retry(self, attempt: int, category: str) -> bool:
+        """attempt 为已重试次数"""
+        return category != FATAL and attempt < self.max_retries
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        headers = error_headers(error)
+        value = headers.get('Retry-After') if headers is not None else None
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def delay(self, attempt: int, error: Exception) -> float:
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return self.backoff(attempt)
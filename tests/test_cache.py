@@ -0,0 +1,55 @@
+import asyncio
+
+from src.cache import AsyncSingleFlight, MessageCache
+
+
+def test_async_single_flight_leader_cancelled_follower_retries():
+    async def run():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        leader = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        result, shared = await follower
+        assert leader.cancelled()
+        assert (result, shared) == (2, False)
+        assert flight._calls == {}
+
+    asyncio.run(run())
+
+
+def test_async_single_flight_shares_result():
+    async def run():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(3)))
+        assert [result for result, _ in results] == ["done"] * 3
+        assert sorted(shared for _, shared in results) == [False, True, True]
+        assert len(calls) == 1
+
+    asyncio.run(run())
+
+
+def test_make_key_separates_pinned_keys():
+    unpinned = MessageCache.make_key("dify", {}, {}, "描述")
+    case_info = MessageCache.make_key("dify", {}, {}, "描述", "app-case-info")
+    law = MessageCache.make_key("dify", {}, {}, "描述", "app-law")
+
+    assert len({unpinned, case_info, law}) == 3
+    assert case_info == MessageCache.make_key("dify", {}, {}, "描述", "app-case-info")
+    assert "app-law" not in law
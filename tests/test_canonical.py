@@ -0,0 +1,31 @@
+from collections import Counter
+
+from src.canonical import SimHashIndex, _feature_hash, simhash
+
+
+def reference_simhash(text, shingle=3):
+    if len(text) <= shingle:
+        features = Counter([text])
+    else:
+        features = Counter(text[i:i + shingle] for i in range(len(text) - shingle + 1))
+    weights = [0] * 64
+    for feature, count in features.items():
+        value = _feature_hash(feature)
+        for bit in range(64):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def test_simhash_matches_bitwise_definition():
+    for text in ("", "ab", "案件描述", "姓名: 张三\n金额: 100\n描述: 借款纠纷" * 20):
+        assert simhash(text) == reference_simhash(text)
+
+
+def test_index_finds_near_duplicates_within_scope():
+    index = SimHashIndex(max_distance=3)
+    text = "姓名: 张三\n金额: 100\n描述: 借款纠纷，被告未按期归还借款" * 5
+    index.add("a", simhash(text), "dify")
+
+    assert index.query(simhash(text), "dify") == ("a", 0)
+    assert index.query(simhash(text), "openai") is None
+    assert index.query(simhash(text), "dify", exclude="a") is None
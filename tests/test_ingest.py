@@ -0,0 +1,79 @@
+import csv
+
+import openpyxl
+
+from src.ingest import iter_messages
+
+HEADER = ["编号", "姓名", "金额", "描述"]
+ROWS = [
+    [1, "张三", 2.5, "纠纷"],
+    [2, None, 3, "盗窃"],
+    [None, None, None, None],
+    [4, "李四", None, "诈骗"],
+    [None, "王五", 10, None],
+]
+
+
+def write_xlsx(path):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(HEADER)
+    for row in ROWS:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def write_csv(path):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for row in ROWS:
+            writer.writerow(["" if value is None else value for value in row])
+
+
+def test_xlsx_and_csv_produce_identical_messages(tmp_path):
+    write_xlsx(tmp_path / "cases.xlsx")
+    write_csv(tmp_path / "cases.csv")
+
+    excel = list(iter_messages(tmp_path / "cases.xlsx"))
+    table = list(iter_messages(tmp_path / "cases.csv"))
+
+    assert excel == table
+    assert excel[0] == "编号: 1\n姓名: 张三\n金额: 2.5\n描述: 纠纷"
+    assert excel[4].startswith("编号: None\n姓名: 王五\n金额: 10\n")
+
+
+def test_csv_keeps_text_values(tmp_path):
+    # 长数字与前导零在 Excel 中为文本单元格；CSV 的空单元格不能让整列被推断为浮点数
+    header = ["身份证号", "编号"]
+    rows = [["510123199001011234", "0012"], [None, None], ["110101200001010011", "0100"]]
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(tmp_path / "ids.xlsx")
+    with open(tmp_path / "ids.csv", "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+
+    excel = list(iter_messages(tmp_path / "ids.xlsx"))
+    table = list(iter_messages(tmp_path / "ids.csv"))
+
+    assert excel == table
+    assert table[0] == "身份证号: 510123199001011234\n编号: 0012"
+    assert table[1] == "身份证号: None\n编号: None"
+
+
+def test_empty_rows_keep_row_numbers(tmp_path):
+    write_xlsx(tmp_path / "cases.xlsx")
+    write_csv(tmp_path / "cases.csv")
+
+    for name in ("cases.xlsx", "cases.csv"):
+        messages = list(iter_messages(tmp_path / name, start_row=3))
+        assert len(messages) == len(ROWS) - 1
+        # 第 4 行为空行，仍占一个序号，第 5 行的消息序号为 5 - 3
+        assert messages[1] == "编号: None\n姓名: None\n金额: None\n描述: None"
+        assert messages[2].startswith("编号: 4\n")
@@ -0,0 +1,63 @@
+from src.journal import CheckpointJournal
+from src.requestor import RequestCoordinator
+from src.result import RequestResult
+
+
+class FakeClient:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def send_request(self, message, provider=None, api_key=None, key_index=None, **kwargs):
+        self.sent.append(message)
+        if message in self.failing:
+            return RequestResult(provider, success=False, error="boom")
+        return RequestResult(provider, f"re:{message}")
+
+
+def test_load_skips_torn_tail_and_next_record_starts_on_new_line(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    with CheckpointJournal(path) as journal:
+        journal.record(0, CheckpointJournal.message_hash("a"), RequestResult("dify", "re:a"))
+        journal.record(1, CheckpointJournal.message_hash("b"), RequestResult("dify", "re:b"))
+    # 模拟写到一半时崩溃
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"index": 2, "hash": "')
+
+    journal = CheckpointJournal(path)
+    assert sorted(journal.load()) == [0, 1]
+
+    journal.record(2, CheckpointJournal.message_hash("c"), RequestResult("dify", "re:c"))
+    journal.close()
+    entries = CheckpointJournal(path).load()
+    assert sorted(entries) == [0, 1, 2]
+    assert entries[2]["result"]["content"] == "re:c"
+
+
+def test_resume_skips_completed_and_retries_failed(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    messages = ["a", "b", "c"]
+    with CheckpointJournal(path) as journal:
+        first = RequestCoordinator(FakeClient(failing={"b"}), max_workers=2).batch_request(
+            messages, provider="dify", journal=journal)
+    assert [result["success"] for result in first] == [True, False, True]
+
+    client = FakeClient()
+    with CheckpointJournal(path) as journal:
+        coordinator = RequestCoordinator(client, max_workers=2)
+        results = coordinator.batch_request(messages, provider="dify", journal=journal)
+    assert client.sent == ["b"]
+    assert [result["content"] for result in results] == ["re:a", "re:b", "re:c"]
+    assert coordinator.get_progress()["resumed"] == 2
+
+    # retry_failed=False 时失败的记录同样视为已完成；消息变化时哈希不一致，不复用旧结果
+    path = tmp_path / "failed.jsonl"
+    with CheckpointJournal(path) as journal:
+        RequestCoordinator(FakeClient(failing={"b"}), max_workers=2).batch_request(
+            messages, provider="dify", journal=journal)
+    client = FakeClient()
+    with CheckpointJournal(path) as journal:
+        results = list(RequestCoordinator(client, max_workers=2).iter_request(
+            ["a", "b", "d"], provider="dify", journal=journal, ordered=True, retry_failed=False))
+    assert client.sent == ["d"]
+    assert [result["success"] for _, result in results] == [True, False, True]
@@ -0,0 +1,42 @@
+import pytest
+
+from src import ratelimit
+from src.ratelimit import RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_reserve_waits_for_deficit_in_reservation_order(clock):
+    bucket = TokenBucket(60, capacity=2)  # 每秒 1 个令牌
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # 透支后按预占顺序排队：第 3、4 个请求分别等待 1 秒与 2 秒
+    assert bucket.reserve() == pytest.approx(1)
+    assert bucket.reserve() == pytest.approx(2)
+
+    clock[0] += 3
+    assert bucket.reserve() == pytest.approx(0)
+    clock[0] += 10
+    # 补充量不超过 capacity
+    assert bucket.reserve(3) == pytest.approx(1)
+
+
+def test_default_capacity_is_ten_seconds_of_rate():
+    assert TokenBucket(600).capacity == 100
+    assert TokenBucket(3).capacity == 1
+
+
+def test_rate_limiter_waits_for_the_slowest_bucket(clock):
+    limiter = RateLimiter({"openai": {
+        "keys": ["k1", "k2"],
+        "rate_limit": {"rpm": 600},
+        "key_rate_limit": [{"tpm": 600, "tpm_burst": 100}, None],
+    }})
+    assert limiter.reserve("openai", "k1", 100) == 0
+    assert limiter.reserve("openai", "k1", 50) == pytest.approx(5)
+    assert limiter.reserve("openai", "k2", 10000) == 0
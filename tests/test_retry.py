@@ -0,0 +1,59 @@
+import time
+from email.utils import formatdate
+
+import aiohttp
+import pytest
+import requests
+
+from src.retry import FATAL, RATE_LIMITED, RETRYABLE, RetryPolicy
+
+
+def http_error(status, headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return requests.HTTPError(response=response)
+
+
+@pytest.mark.parametrize("error, category", [
+    (http_error(429), RATE_LIMITED),
+    (http_error(503), RETRYABLE),
+    (http_error(599), RETRYABLE),
+    (http_error(408), RETRYABLE),
+    (http_error(400), FATAL),
+    (http_error(401), FATAL),
+    (aiohttp.ClientResponseError(None, (), status=429), RATE_LIMITED),
+    (aiohttp.ClientResponseError(None, (), status=404), FATAL),
+    (requests.ConnectionError(), RETRYABLE),
+    (requests.Timeout(), RETRYABLE),
+    (TimeoutError(), RETRYABLE),
+    (ValueError("bad response"), FATAL),
+])
+def test_classify(error, category):
+    assert RetryPolicy().classify(error) == category
+
+
+def test_should_retry_stops_at_max_retries_and_on_fatal():
+    policy = RetryPolicy(max_retries=2)
+    assert policy.should_retry(1, RETRYABLE)
+    assert not policy.should_retry(2, RETRYABLE)
+    assert not policy.should_retry(0, FATAL)
+
+
+def test_retry_after_seconds_and_http_date():
+    policy = RetryPolicy(max_retry_after=120)
+    assert policy.retry_after(http_error(429, {"Retry-After": "7"})) == 7
+    assert policy.retry_after(http_error(429, {"Retry-After": "-3"})) == 0
+    assert policy.retry_after(http_error(429, {"Retry-After": "soon"})) is None
+    assert policy.retry_after(http_error(429)) is None
+
+    date = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= policy.retry_after(http_error(429, {"Retry-After": date})) <= 30
+    headers = {"Retry-After": "600"}
+    assert policy.delay(0, aiohttp.ClientResponseError(None, (), status=429, headers=headers)) == 120
+
+
+def test_backoff_is_capped_full_jitter():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt in range(6):
+        assert 0 <= policy.delay(attempt, http_error(503)) <= min(5, 2 ** attempt)
@@ -0,0 +1,42 @@
+from src.case.segments import SegmentStore
+
+
+def test_get_reads_buffered_records_without_flushing(tmp_path):
+    store = SegmentStore(tmp_path, flush_every=100, flush_interval=3600)
+    store.append("a", {"value": 1})
+    store.append("a", {"value": 2})
+
+    assert store.get("a") == {"value": 2}
+    # 读取不应提前落盘
+    assert not (tmp_path / "segment_000001.jsonl").exists()
+
+    store.close()
+    reopened = SegmentStore(tmp_path)
+    assert reopened.get("a") == {"value": 2}
+    reopened.close()
+
+
+def test_recover_rebuilds_index_and_truncates_torn_tail(tmp_path):
+    store = SegmentStore(tmp_path, flush_every=1)
+    store.append("a", {"value": 1})
+    store.append("b", {"value": 2})
+    store.close()
+    segment = tmp_path / "segment_000001.jsonl"
+    size = segment.stat().st_size
+    # 模拟崩溃：b 已写入段文件但索引未写入，段文件末尾还有写了一半的记录
+    index = tmp_path / SegmentStore.INDEX_FILE
+    index.write_text(index.read_text(encoding="utf-8").splitlines(keepends=True)[0], encoding="utf-8")
+    with open(segment, "ab") as f:
+        f.write(b'{"id":"c","data":')
+
+    store = SegmentStore(tmp_path, flush_every=1)
+    assert segment.stat().st_size == size
+    assert store.get("b") == {"value": 2}
+    assert "c" not in store
+
+    store.append("c", {"value": 3})
+    store.close()
+    store = SegmentStore(tmp_path)
+    assert [record_id for record_id, _ in store.iter_records()] == ["a", "b", "c"]
+    assert store.get("c") == {"value": 3}
+    store.close()